@@ -0,0 +1,192 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+import registry
+from profiling import PhaseTimer
+
+
+# Configurations per model. Sizes go beyond the sidebar limits on purpose, to see how the cores scale
+MATRIX = {
+    "Ising": (
+        [{"N": N, "update_method": "Checkerboard"} for N in (50, 100, 200, 400)]
+        + [{"N": N, "update_method": "Wolff cluster", "temperature": 2.27} for N in (50, 100, 200, 400)]
+        + [{"N": N, "update_method": "Sequential"} for N in (50, 100)]
+    ),
+    "Sandpile": [{"N": N, "add_location": "Random", "topple_method": method} for method in ("Worklist", "Parallel wave") for N in (50, 100, 200, 400)],
+    "Lichen": (
+        [{"L": L} for L in (50, 100, 200, 400)]
+        + [{"L": L, "storage": "Tiles"} for L in (200, 1000, 4000)]
+        + [{"L": L, "update_method": "Kinetic Monte Carlo"} for L in (200, 1000)]
+    ),
+    # Constant mean degree of 10, so the number of edges grows linearly with N
+    "Erdos-Renyi Network": [{"N": N, "p": 10 / N} for N in (100, 1000, 10_000, 100_000)],
+}
+
+# For every model: what one event is, the number of events in the last number_of_steps steps,
+# and the number of steps in one sweep over all sites (None where a sweep is not meaningful)
+EVENTS = {
+    "Ising": ("spin update", lambda simulation, number_of_steps: number_of_steps * simulation.N**2, lambda simulation: 1),
+    "Sandpile": ("toppling", lambda simulation, number_of_steps: simulation.avalanche_size, lambda simulation: None),
+    "Lichen": ("invasion attempt", lambda simulation, number_of_steps: number_of_steps, lambda simulation: simulation.L**2),
+    "Erdos-Renyi Network": ("edge change", lambda simulation, number_of_steps: 2 * number_of_steps, lambda simulation: None),
+}
+
+
+def _initialized(cls, model, parameters, seed):
+    # Not created through registry.create_simulation, as the benchmark sizes are outside the parameter schema
+    simulation = cls(**parameters, seed=seed)
+    getattr(simulation, registry.MODELS[model]["initialize"])()
+    return simulation
+
+
+def _steps_per_call(model, simulation):
+    """Models with a batched step function advance one sweep per call, the others a single step,
+    so events that are counted per step are not lost.
+    """
+    sweep = EVENTS[model][2](simulation)
+    return sweep if "batch_step" in registry.MODELS[model] and sweep else 1
+
+
+def measure_throughput(model, parameters, seed=0, time_budget=1., warmup=1):
+    """Steps, sweeps and events per second of the simulation core, advanced until time_budget seconds have passed."""
+    simulation = _initialized(registry.load_core(model), model, parameters, seed)
+    event_name, count_events, steps_per_sweep = EVENTS[model]
+    steps_per_call = _steps_per_call(model, simulation)
+    registry.advance(model, simulation, warmup * steps_per_call)
+
+    steps = events = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < time_budget:
+        registry.advance(model, simulation, steps_per_call)
+        steps += steps_per_call
+        events += count_events(simulation, steps_per_call)
+    elapsed = time.perf_counter() - start
+
+    sweep = steps_per_sweep(simulation)
+    return {
+        "steps": steps, "seconds": elapsed, "steps_per_second": steps / elapsed,
+        "sweeps_per_second": steps / sweep / elapsed if sweep else None,
+        "event": event_name, "events_per_second": events / elapsed,
+    }
+
+
+def measure_memory(model, parameters, seed=0, number_of_calls=5):
+    """Peak traced memory in bytes while creating the simulation core and advancing it a few times.
+    Measured separately from the throughput, since tracing allocations slows everything down.
+    """
+    tracemalloc.start()
+    try:
+        simulation = _initialized(registry.load_core(model), model, parameters, seed)
+        registry.advance(model, simulation, number_of_calls * _steps_per_call(model, simulation))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_rendering(model, parameters, seed=0, number_of_frames=10, steps_per_frame=None):
+    """Latency of the analysis and render phases of the Streamlit UI of the model, drawing frames outside of a running app.
+    The frames still go through all of the drawing and image encoding, only nothing is sent to a browser.
+    """
+    ui = _initialized(registry.load_ui(model), model, parameters, seed)
+    ui.steps_per_frame = 1  # Sidebar settings that the UI needs for its frames
+    ui._initial_image()
+    steps_per_frame = steps_per_frame or _steps_per_call(model, ui)
+
+    timer = PhaseTimer(window=number_of_frames)
+    for frame in range(number_of_frames):
+        registry.advance(model, ui, steps_per_frame)
+        with timer.phase("analysis"):
+            snapshot = ui._snapshot()
+        with timer.phase("render"):
+            ui._append_fig(frame, snapshot)
+    plt.close("all")
+    summary = timer.summary()
+    return {"analysis_ms": summary["analysis"]["mean_ms"], "render_ms": summary["render"]["mean_ms"]}
+
+
+def run(models=None, time_budget=1., render_frames=10, max_size=None, seed=0):
+    """Benchmark every configuration of MATRIX for the given models. Returns one result per configuration."""
+    results = []
+    for model in models or list(MATRIX):
+        for parameters in MATRIX[model]:
+            size = parameters.get("N", parameters.get("L"))
+            if max_size is not None and size > max_size:
+                continue
+            result = {"model": model, "parameters": parameters}
+            result.update(measure_throughput(model, parameters, seed, time_budget))
+            result["peak_memory_bytes"] = measure_memory(model, parameters, seed)
+            if render_frames:
+                result.update(measure_rendering(model, parameters, seed, render_frames))
+            print(_format(result), flush=True)
+            results.append(result)
+    return results
+
+
+def _describe(result):
+    parameters = ", ".join(f"{name}={value:g}" if isinstance(value, float) else f"{name}={value}" for name, value in result["parameters"].items())
+    return f"{result['model']} ({parameters})"
+
+
+def _format(result):
+    sweeps = f", {result['sweeps_per_second']:.3g} sweeps/s" if result["sweeps_per_second"] is not None else ""
+    render = f", render {result['render_ms']:.1f} ms" if "render_ms" in result else ""
+    return (
+        f"{_describe(result)}: {result['steps_per_second']:.3g} steps/s{sweeps}, "
+        f"{result['events_per_second']:.3g} {result['event']}s/s, peak {result['peak_memory_bytes'] / 1e6:.1f} MB{render}"
+    )
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Configurations that got slower than the baseline by more than the tolerance, as (description, old, new) tuples.
+    Throughput is compared through steps per second and rendering through the render latency.
+    """
+    old_results = {(result["model"], json.dumps(result["parameters"], sort_keys=True)): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = old_results.get((result["model"], json.dumps(result["parameters"], sort_keys=True)))
+        if old is None:
+            continue
+        if result["steps_per_second"] < (1 - tolerance) * old["steps_per_second"]:
+            regressions.append((f"{_describe(result)} steps/s", old["steps_per_second"], result["steps_per_second"]))
+        if "render_ms" in result and "render_ms" in old and result["render_ms"] > (1 + tolerance) * old["render_ms"]:
+            regressions.append((f"{_describe(result)} render ms", old["render_ms"], result["render_ms"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput, memory use and render latency of the models without the Streamlit app.",
+        epilog="Example: python benchmark.py --models Ising Lichen --output baseline.json, later python benchmark.py --compare baseline.json",
+    )
+    parser.add_argument("--models", nargs="+", choices=list(MATRIX), default=list(MATRIX), help="Models to benchmark")
+    parser.add_argument("--time-budget", type=float, default=1., help="Seconds of stepping per configuration")
+    parser.add_argument("--render-frames", type=int, default=10, help="Frames drawn per configuration, 0 to skip rendering")
+    parser.add_argument("--max-size", type=int, default=None, help="Skip configurations with a larger N or L")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of every simulation")
+    parser.add_argument("--output", default="benchmark.json", help="Output .json file")
+    parser.add_argument("--compare", default=None, help="Earlier output .json file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before a regression is reported")
+    args = parser.parse_args()
+
+    results = run(args.models, args.time_budget, args.render_frames, args.max_size, args.seed)
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": platform.python_version(),
+        "numpy": np.__version__, "machine": platform.platform(), "processor": platform.processor(), "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved {len(results)} results to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for description, old, new in regressions:
+            print(f"Regression in {description}: {old:.3g} -> {new:.3g}")
+        raise SystemExit(1 if regressions else 0)
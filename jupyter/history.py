@@ -0,0 +1,208 @@
+import hashlib
+import json
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from result_cache import DEFAULT_DIRECTORY
+
+
+HISTORY_DIRECTORY = DEFAULT_DIRECTORY / "history"
+
+
+def history_directory(model, parameters, session="default"):
+    """Directory of the history of a model with the given parameters, so it is found again after a Streamlit rerun.
+    Every session has its own directory, so concurrent sessions with the same parameters do not write to the same files.
+    """
+    description = json.dumps([model, parameters], sort_keys=True, default=str)
+    return HISTORY_DIRECTORY / str(session) / hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+def evict_histories(max_bytes=2_000_000_000, keep=None, root=None):
+    """Delete the least recently written histories until all histories together take at most max_bytes on disk.
+    Histories are never deleted explicitly when a session ends, so this is what bounds their disk usage.
+    """
+    root = Path(root or HISTORY_DIRECTORY)
+    entries = []
+    for directory in root.glob("*/*"):
+        if not directory.is_dir():
+            continue
+        try:
+            stats = [path.stat() for path in directory.iterdir()]
+        except FileNotFoundError:  # Deleted by another session
+            continue
+        entries.append((max((stat.st_mtime for stat in stats), default=0), sum(stat.st_size for stat in stats), directory))
+    total = sum(size for _, size, _ in entries)
+    for _, size, directory in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and directory == Path(keep):
+            continue
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
+    for session in root.glob("*"):
+        if session.is_dir() and not any(session.iterdir()):
+            session.rmdir()
+
+
+class GridHistory:
+    def __init__(self, directory, shape, dtype, checkpoint_interval=100, max_bytes=500_000_000):
+        """Grid of every frame of a run, appended to a file on disk and read back through a memory map, so it is never held in RAM.
+        Every checkpoint_interval frames a checkpoint of the simulation is stored as well, so the run can be resumed
+        from the last checkpoint. An existing history with the same grid shape and dtype is continued.
+        When the grids would take more than max_bytes, every other frame is dropped and from then on only every
+        stride-th appended frame is stored, so a long run is kept at a coarser resolution instead of filling the disk.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.checkpoint_interval = checkpoint_interval
+        self.max_bytes = max_bytes
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.grid_path = self.directory / "grids.bin"
+        self.step_path = self.directory / "steps.bin"
+        self.metadata_path = self.directory / "metadata.json"
+        self._memmap = None
+        self.unrecorded = 0  # Frames appended since the last stored frame
+
+        metadata = json.loads(self.metadata_path.read_text()) if self.metadata_path.exists() else {}
+        if metadata.get("shape") != list(self.shape) or metadata.get("dtype") != self.dtype.str:
+            self.clear()
+        else:
+            self.stride = metadata["stride"]
+
+
+    def _write_metadata(self):
+        self.metadata_path.write_text(json.dumps({"shape": list(self.shape), "dtype": self.dtype.str, "stride": self.stride}))
+
+
+    def __len__(self):
+        if not self.step_path.exists():
+            return 0
+        # Frames of a run interrupted while writing are ignored
+        return min(self.step_path.stat().st_size // 8, self.grid_path.stat().st_size // self.frame_bytes)
+
+
+    def clear(self):
+        self._memmap = None
+        self.stride = 1
+        self._write_metadata()
+        for path in self.directory.glob("*.bin"):
+            path.unlink()
+        for path in self.directory.glob("checkpoint_*.pkl"):
+            path.unlink()
+
+
+    def append(self, grid, step, checkpoint=None, final=False):
+        """Store the grid after the given simulation step, or skip it if only every stride-th frame is stored.
+        checkpoint() is called when a checkpoint is due, which is every checkpoint_interval stored frames
+        and at the final frame of a run.
+        """
+        self.unrecorded += 1
+        if len(self) > 0 and self.unrecorded < self.stride and not final:
+            return
+        self.unrecorded = 0
+        if (len(self) + 1) * self.frame_bytes > self.max_bytes and len(self) > 1:
+            self._decimate()
+        frame = len(self)
+        with open(self.grid_path, "ab") as file:
+            file.write(np.ascontiguousarray(grid, dtype=self.dtype).tobytes())
+        with open(self.step_path, "ab") as file:
+            file.write(np.int64(step).tobytes())
+        if checkpoint is not None and (frame % self.checkpoint_interval == 0 or final):
+            self.save_checkpoint(frame, checkpoint())
+
+
+    def _decimate(self):
+        """Keep every other frame, and the checkpoints of the kept frames, and double the stride."""
+        frames = self._frames()
+        steps = np.fromfile(self.step_path, dtype=np.int64, count=len(frames))
+        with open(self.grid_path.with_suffix(".tmp"), "wb") as file:
+            for index in range(0, len(frames), 2):
+                file.write(frames[index].tobytes())
+        self._memmap = None
+        del frames
+        self.grid_path.with_suffix(".tmp").replace(self.grid_path)
+        steps[::2].tofile(self.step_path)
+        # Ascending order, so a checkpoint is only renamed onto a frame whose own checkpoint was already moved or deleted
+        for frame in sorted(int(path.stem.split("_")[1]) for path in self.directory.glob("checkpoint_*.pkl")):
+            path = self.directory / f"checkpoint_{frame}.pkl"
+            if frame % 2:
+                path.unlink()
+            else:
+                path.replace(self.directory / f"checkpoint_{frame // 2}.pkl")
+        self.stride *= 2
+        self._write_metadata()
+
+
+    def start(self, simulation, grid, resume=False):
+        """Prepare the history for a run of simulation and return the step the run starts from.
+        With resume, the simulation is restored from the latest checkpoint and the frames after it are dropped.
+        Otherwise, or if there is no checkpoint, the history is cleared and grid is recorded as the initial frame.
+        """
+        latest = self.latest_checkpoint() if resume else None
+        if latest is None:
+            self.clear()
+            self.append(grid, 0, simulation.checkpoint)
+            return 0
+        frame, checkpoint = latest
+        simulation.restore(checkpoint)
+        self.truncate(frame + 1)
+        return self.frame(frame)[0]
+
+
+    def _frames(self):
+        number_of_frames = len(self)
+        if self._memmap is None or len(self._memmap) != number_of_frames:
+            self._memmap = np.memmap(self.grid_path, dtype=self.dtype, mode="r", shape=(number_of_frames, *self.shape))
+        return self._memmap
+
+
+    def frame(self, index):
+        """(step, grid) of a frame. The grid is read from disk."""
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame {index} is not in a history of {len(self)} frames")
+        step = np.fromfile(self.step_path, dtype=np.int64, count=1, offset=8 * index)[0]
+        return int(step), np.array(self._frames()[index])
+
+
+    def replay(self, start=0):
+        """Yield (step, grid) of all frames from start, without recomputing anything."""
+        for index in range(start, len(self)):
+            yield self.frame(index)
+
+
+    def save_checkpoint(self, frame, checkpoint):
+        with open(self.directory / f"checkpoint_{frame}.pkl", "wb") as file:
+            pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+    def latest_checkpoint(self):
+        """(frame, checkpoint) of the last checkpoint within the stored frames, or None if there is none."""
+        frames = [int(path.stem.split("_")[1]) for path in self.directory.glob("checkpoint_*.pkl")]
+        frames = [frame for frame in frames if frame < len(self)]
+        if not frames:
+            return None
+        with open(self.directory / f"checkpoint_{max(frames)}.pkl", "rb") as file:
+            return max(frames), pickle.load(file)
+
+
+    def truncate(self, number_of_frames):
+        """Drop all frames after the first number_of_frames, e.g. to continue from an earlier checkpoint."""
+        self._memmap = None
+        self.unrecorded = 0
+        with open(self.grid_path, "r+b") as file:
+            file.truncate(number_of_frames * self.frame_bytes)
+        with open(self.step_path, "r+b") as file:
+            file.truncate(number_of_frames * 8)
+        for path in self.directory.glob("checkpoint_*.pkl"):
+            if int(path.stem.split("_")[1]) >= number_of_frames:
+                path.unlink()
+
+
+    def delete(self):
+        self._memmap = None
+        shutil.rmtree(self.directory)
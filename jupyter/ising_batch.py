@@ -0,0 +1,185 @@
+import argparse
+
+import numpy as np
+
+from sweep import write_table
+
+
+class BatchedIsingSimulation:
+    def __init__(self, N=50, temperatures=(2.0,), copies=1, parallel_tempering=False, swap_interval=1, seed=None):
+        """Many 2D Ising lattices stored as one (R, N, N) int8 array and updated together by a single checkerboard kernel.
+        There are copies independent replicas of every temperature, so R = copies * len(temperatures),
+        and replica r has temperature temperatures[r % len(temperatures)].
+        With parallel_tempering, configurations at neighbouring temperatures of the same copy are offered a swap every swap_interval steps.
+        """
+        self.N = N
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.copies = copies
+        self.parallel_tempering = parallel_tempering
+        self.swap_interval = swap_interval
+        self.seed = seed
+
+
+    def _initialize_grid(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.number_of_temperatures = len(self.temperatures)
+        self.R = self.copies * self.number_of_temperatures
+        self.betas = np.tile(1. / self.temperatures, self.copies)
+        self.grid = self.rng.choice(np.array([-1, 1], dtype=np.int8), size=(self.R, self.N, self.N))
+        self._checkerboard_indices()
+
+        # Acceptance probability of every replica for local fields s * sum(neighbours) = -4, -2, 0, 2, 4
+        delta_E = 2 * np.arange(-4, 5, 2)
+        self.acceptance = np.minimum(1., np.exp(-self.betas[:, None] * delta_E[None, :])).astype(np.float32)
+        self.replica_rows = np.arange(self.R)[:, None]
+
+        # Per replica totals, summed in int64 since int8 would overflow
+        self.total_energy = -np.sum(self.grid * (np.roll(self.grid, 1, axis=1) + np.roll(self.grid, 1, axis=2)), axis=(1, 2), dtype=np.int64)
+        self.total_spin = np.sum(self.grid, axis=(1, 2), dtype=np.int64)
+        self.magnetization = [np.abs(self.total_spin) / self.N**2]
+        self.energy = [self.total_energy / self.N**2]
+        self.step_count = 0
+        self.swap_attempts = np.zeros(self.number_of_temperatures - 1, dtype=np.int64)
+        self.swap_accepts = np.zeros(self.number_of_temperatures - 1, dtype=np.int64)
+
+
+    def _checkerboard_indices(self):
+        """Flat indices of the two sublattices and of the four neighbours of their sites, as in IsingSimulation.
+        Requires N to be even.
+        """
+        if self.N % 2:
+            raise ValueError("The checkerboard update needs an even grid size N")
+        idx = np.arange(self.N * self.N).reshape(self.N, self.N)
+        neighbours = np.stack([
+            np.roll(idx, 1, axis=0).ravel(), np.roll(idx, -1, axis=0).ravel(),
+            np.roll(idx, 1, axis=1).ravel(), np.roll(idx, -1, axis=1).ravel()
+        ], axis=1)
+        parity = (np.add.outer(np.arange(self.N), np.arange(self.N)) % 2).ravel()
+        self.checkerboard = [(sites, neighbours[sites].T) for sites in (np.flatnonzero(parity == 0), np.flatnonzero(parity == 1))]
+
+
+    def _sweep(self):
+        """Metropolis sweep of all replicas, one sublattice at a time. Each replica looks up its own acceptance table."""
+        grid = self.grid.reshape(self.R, -1)  # View, so updates are written to the grid
+        for sites, (up, down, left, right) in self.checkerboard:
+            spins = grid[:, sites]
+            field = grid[:, up] + grid[:, down] + grid[:, left] + grid[:, right]  # At most 4 in magnitude, fits in int8
+            acceptance = self.acceptance[self.replica_rows, (spins * field + 4) >> 1]
+            change = -2 * spins * (self.rng.random(spins.shape, dtype=np.float32) < acceptance)
+            grid[:, sites] = spins + change
+            self.total_energy -= np.sum(change * field, axis=1, dtype=np.int64)
+            self.total_spin += np.sum(change, axis=1, dtype=np.int64)
+
+
+    def _swap(self):
+        """Parallel tempering: offer swaps between neighbouring temperatures of every copy, alternating between even and odd pairs.
+        A swap of configurations at beta_i and beta_j is accepted with probability min(1, exp((beta_i - beta_j)(E_i - E_j))).
+        """
+        first = self.step_count // self.swap_interval % 2
+        pairs = np.arange(first, self.number_of_temperatures - 1, 2)
+        lower = (pairs[None, :] + self.number_of_temperatures * np.arange(self.copies)[:, None]).ravel()
+        upper = lower + 1
+        log_probability = (self.betas[lower] - self.betas[upper]) * (self.total_energy[lower] - self.total_energy[upper])
+        accepted = self.rng.random(lower.size) < np.exp(np.minimum(log_probability, 0.))
+
+        np.add.at(self.swap_attempts, lower % self.number_of_temperatures, 1)
+        np.add.at(self.swap_accepts, lower[accepted] % self.number_of_temperatures, 1)
+        # Swapping the configurations keeps replica r at its temperature, so the time series stay per temperature
+        order = np.arange(self.R)
+        order[lower[accepted]], order[upper[accepted]] = upper[accepted], lower[accepted]
+        self.grid = self.grid[order]
+        self.total_energy = self.total_energy[order]
+        self.total_spin = self.total_spin[order]
+
+
+    def _ising_step(self):
+        self._sweep()
+        self.step_count += 1
+        if self.parallel_tempering and self.number_of_temperatures > 1 and self.step_count % self.swap_interval == 0:
+            self._swap()
+        self.magnetization.append(np.abs(self.total_spin) / self.N**2)
+        self.energy.append(self.total_energy / self.N**2)
+
+
+    def _ising_steps(self, number_of_steps):
+        for _ in range(number_of_steps):
+            self._ising_step()
+
+
+    def swap_acceptance(self):
+        """Fraction of accepted swaps between temperature t and t + 1."""
+        return self.swap_accepts / np.maximum(self.swap_attempts, 1)
+
+
+    def observables(self, warmup=0):
+        """Time averages per temperature over all copies, skipping the first warmup steps.
+        Returns |m|, susceptibility, energy and specific heat per spin, with one entry per temperature.
+        """
+        m = np.array(self.magnetization[warmup + 1:]).reshape(-1, self.copies, self.number_of_temperatures)
+        e = np.array(self.energy[warmup + 1:]).reshape(-1, self.copies, self.number_of_temperatures)
+        beta = 1. / self.temperatures
+        # Fluctuations are taken per copy and then averaged, so independent copies do not add spurious variance
+        return {
+            "magnetization": m.mean(axis=(0, 1)),
+            "susceptibility": beta * self.N**2 * m.var(axis=0).mean(axis=0),
+            "energy": e.mean(axis=(0, 1)),
+            "specific_heat": beta**2 * self.N**2 * e.var(axis=0).mean(axis=0),
+        }
+
+
+    def state(self):
+        return {
+            "grid": self.grid, "magnetization": self.magnetization[-1], "energy": self.energy[-1],
+            "swap_acceptance": self.swap_acceptance(),
+        }
+
+
+    def checkpoint(self):
+        """Copy of everything that changes during the simulation, enough to continue it exactly with restore()."""
+        return {
+            "grid": self.grid.copy(), "rng": self.rng.bit_generator.state, "total_energy": self.total_energy.copy(),
+            "total_spin": self.total_spin.copy(), "magnetization": list(self.magnetization), "energy": list(self.energy),
+            "step_count": self.step_count, "swap_attempts": self.swap_attempts.copy(), "swap_accepts": self.swap_accepts.copy(),
+        }
+
+
+    def restore(self, checkpoint):
+        """Continue from a checkpoint. The simulation must be initialized with the same parameters."""
+        self.grid = checkpoint["grid"].copy()
+        self.rng.bit_generator.state = checkpoint["rng"]
+        self.total_energy = checkpoint["total_energy"].copy()
+        self.total_spin = checkpoint["total_spin"].copy()
+        self.magnetization = list(checkpoint["magnetization"])
+        self.energy = list(checkpoint["energy"])
+        self.step_count = checkpoint["step_count"]
+        self.swap_attempts = checkpoint["swap_attempts"].copy()
+        self.swap_accepts = checkpoint["swap_accepts"].copy()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the Ising model at many temperatures at once and write mean observables to a CSV table.")
+    parser.add_argument("--N", type=int, default=32, help="Grid size, must be even")
+    parser.add_argument("--temperatures", type=float, nargs="+", default=list(np.linspace(1.5, 3.5, 17)), help="Temperature ladder")
+    parser.add_argument("--copies", type=int, default=4, help="Independent replicas per temperature")
+    parser.add_argument("--steps", type=int, default=2000, help="Measured sweeps")
+    parser.add_argument("--warmup", type=int, default=500, help="Sweeps before measuring")
+    parser.add_argument("--tempering", action="store_true", help="Swap configurations between neighbouring temperatures")
+    parser.add_argument("--swap-interval", type=int, default=1, help="Sweeps between swap rounds")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument("--output", default="ising_batch.csv", help="Output .csv file")
+    args = parser.parse_args()
+
+    simulation = BatchedIsingSimulation(N=args.N, temperatures=sorted(args.temperatures), copies=args.copies,
+                                        parallel_tempering=args.tempering, swap_interval=args.swap_interval, seed=args.seed)
+    simulation._initialize_grid()
+    simulation._ising_steps(args.warmup + args.steps)
+
+    observables = simulation.observables(warmup=args.warmup)
+    swap_acceptance = np.append(simulation.swap_acceptance(), np.nan)
+    rows = [
+        {"temperature": float(temperature), "copies": args.copies, **{name: float(values[t]) for name, values in observables.items()},
+         "swap_acceptance": float(swap_acceptance[t])}
+        for t, temperature in enumerate(simulation.temperatures)
+    ]
+    write_table(rows, args.output)
+    print(f"Simulated {simulation.R} lattices of {args.N}x{args.N} for {args.warmup + args.steps} sweeps, saved to {args.output}")
@@ -0,0 +1,270 @@
+from collections import deque
+
+import numpy as np
+
+
+class IsingSimulation:
+    # Entries kept of every time series, so memory does not grow with the number of steps. Covers the plots and fit windows
+    series_length = 1000
+    # The correlation length is fitted to the average structure factor of the last structure_window measurements,
+    # at the lowest structure_shells non-zero wave numbers
+    structure_window = 20
+    structure_shells = 3
+
+
+    def __init__(self, N=50, temperature=2.0, time_steps=100, update_method="Checkerboard", structure_interval=10, seed=None):
+        """Simulation core of the 2D Ising model, without any plotting or Streamlit code.
+        Parameters default to the sidebar defaults of IsingModel. 
+        The structure factor and correlation length are measured every structure_interval steps.
+        N must be even, see _checkerboard_masks.
+        """
+        if N % 2:
+            raise ValueError("The Ising model needs an even grid size N")
+        self.N = N
+        self.temperature = temperature
+        self.time_steps = time_steps
+        self.update_method = update_method
+        self.structure_interval = structure_interval
+        self.seed = seed
+    
+    
+    def _initialize_grid(self):
+        # Create an NxN grid with spins randomly set to +1 or -1, stored as int8 to keep large grids small
+        self.rng = np.random.default_rng(self.seed)
+        self.beta = 1. / self.temperature
+        self.grid = self.rng.choice(np.array([-1, 1], dtype=np.int8), size=(self.N, self.N))
+        self._wolff_setup()
+        self._checkerboard_masks()
+        self._boltzmann_table()
+        
+        # Total energy (J = 1) and total spin, updated by every Metropolis flip and counted once per Wolff step
+        self._count_totals()
+        # Time series with one entry per step, per spin, of which the last series_length entries are kept
+        self.steps_done = 0
+        self.magnetization = deque([abs(self.total_spin) / self.N**2], maxlen=self.series_length)
+        self.energy = deque([self.total_energy / self.N**2], maxlen=self.series_length)
+        self.correlation_length = deque(maxlen=self.series_length)  # One entry every structure_interval steps
+        self.structure_samples = deque(maxlen=self.structure_window)  # S(q) at the lowest non-zero wave numbers of every measurement
+        self.structure_sum = np.zeros(self.structure_shells)
+        self._structure_factor_shells()
+        self._measure_structure_factor()
+
+    
+    def _count_totals(self):
+        self.total_energy = int(-np.sum(self.grid * (np.roll(self.grid, 1, axis=0) + np.roll(self.grid, 1, axis=1))))
+        self.total_spin = int(np.sum(self.grid))
+    
+    
+    def _checkerboard_masks(self):
+        """Split the lattice into two sublattices such that no site has a nearest neighbour on its own sublattice.
+        With periodic boundaries this requires N to be even, which __init__ and the parameter schema enforce.
+        Each sublattice is stored as flat site indices with the flat indices of their neighbours, as integer indexing is
+        much faster than boolean masks. Uses the neighbour table of _wolff_setup.
+        """
+        if self.N % 2:
+            # N may have been changed after __init__, e.g. by the sidebar of IsingModel
+            raise ValueError("The checkerboard update needs an even grid size N")
+        parity = (np.add.outer(np.arange(self.N), np.arange(self.N)) % 2).ravel()
+        self.checkerboard = [(sites, self.neighbours[sites]) for sites in (np.flatnonzero(parity == 0), np.flatnonzero(parity == 1))]
+    
+    
+    def _boltzmann_table(self):
+        """Acceptance probabilities for the five possible energy changes delta_E = -8, -4, 0, 4, 8.
+        The table is indexed by (spin * neighbour_sum + 4) // 2.
+        """
+        delta_E = 2 * np.arange(-4, 5, 2)
+        self.acceptance = np.minimum(1., np.exp(-self.beta * delta_E))
+    
+    
+    def _wolff_setup(self):
+        """Flat indices of the four neighbours of every site, the bond probability of the Wolff algorithm,
+        a reusable cluster membership mask and the counts behind the mean cluster size of _wolff_step.
+        """
+        idx = np.arange(self.N * self.N).reshape(self.N, self.N)
+        self.neighbours = np.stack([
+            np.roll(idx, 1, axis=0).ravel(), np.roll(idx, -1, axis=0).ravel(),
+            np.roll(idx, 1, axis=1).ravel(), np.roll(idx, -1, axis=1).ravel()
+        ], axis=1)
+        self.p_add = 1. - np.exp(-2 * self.beta)
+        self.in_cluster = np.zeros(self.N * self.N, dtype=bool)
+        self.wolff_clusters = 0
+        self.wolff_flipped = 0
+    
+    
+    def _ising_step(self):
+        if self.update_method == "Checkerboard":
+            self._checkerboard_step()
+        elif self.update_method == "Wolff cluster":
+            self._wolff_step()
+        else:
+            self._sequential_step()
+        self.magnetization.append(abs(self.total_spin) / self.N**2)
+        self.energy.append(self.total_energy / self.N**2)
+        self.steps_done += 1
+        if self.steps_done % self.structure_interval == 0:
+            self._measure_structure_factor()
+    
+    
+    def _checkerboard_step(self):
+        """Metropolis sweep updating each sublattice at once. Sites on the same sublattice do not interact, 
+        so they can be flipped simultaneously without breaking detailed balance.
+        """
+        grid = self.grid.ravel()  # View, so updates are written to the grid
+        for sites, neighbours in self.checkerboard:
+            spins = grid[sites]
+            field = grid[neighbours].sum(axis=1)
+            local_field = spins * field
+            acceptance = self.acceptance[(local_field + 4) // 2]
+            flip = self.rng.uniform(size=spins.size) < acceptance
+            change = np.where(flip, -2 * spins, 0)
+            grid[sites] = spins + change
+            # The neighbours of a sublattice do not change, so the energy changes by -change . field
+            self.total_energy -= int(change.dot(field))
+            self.total_spin += int(change.sum())
+    
+    
+    def _wolff_step(self):
+        """Flip about N^2 / (mean cluster size) Wolff clusters, such that one step is comparable to one Metropolis sweep.
+        The number of clusters is fixed before the step from the clusters of the earlier steps. Stopping once N^2 spins
+        have been flipped in this step would depend on the clusters just flipped, which favours large clusters and so
+        ordered states, e.g. an energy per spin of -1.20 instead of -1.13 at N = 16 and T = 2.5.
+        The totals are counted once per step rather than updated per cluster. Updating them per cluster made steps
+        6% slower near T_c and up to 30% slower at high temperature, where clusters are small, while counting them
+        takes about 50 microseconds at N = 100, below 1% of a step.
+        """
+        number_of_clusters = max(1, round(self.N**2 * self.wolff_clusters / self.wolff_flipped)) if self.wolff_clusters else 1
+        for _ in range(number_of_clusters):
+            self.wolff_flipped += self._wolff_cluster()
+        self.wolff_clusters += number_of_clusters
+        self._count_totals()
+    
+    
+    def _wolff_cluster(self):
+        """Grow a single cluster from a random seed site and flip it. Aligned neighbours join with probability 1 - exp(-2 beta).
+        The cluster is grown one shell at a time, so each shell is handled with array operations. Returns the cluster size.
+        """
+        spins = self.grid.ravel()  # View, so flipping spins updates the grid
+        seed = self.rng.integers(0, self.N * self.N)
+        spin = spins[seed]
+        self.in_cluster[seed] = True
+        cluster = [np.array([seed])]
+        frontier = cluster[0]
+        while frontier.size > 0:
+            candidates = self.neighbours[frontier].ravel()
+            candidates = candidates[(spins[candidates] == spin) & ~self.in_cluster[candidates]]
+            candidates = candidates[self.rng.uniform(size=candidates.size) < self.p_add]
+            # A site proposed by several frontier sites joins if any of its bonds is activated
+            frontier = np.unique(candidates)
+            self.in_cluster[frontier] = True
+            cluster.append(frontier)
+        
+        cluster = np.concatenate(cluster)
+        spins[cluster] *= -1
+        self.in_cluster[cluster] = False
+        return cluster.size
+    
+    
+    def _autocorrelation(self, window=100):
+        """Lag one autocorrelation of the absolute magnetization over the last window steps. 
+        Values close to 1 mean consecutive frames are strongly correlated.
+        """
+        m = np.array(self.magnetization)[-window:]
+        if m.size < 3 or np.var(m) == 0:
+            return np.nan
+        m = m - m.mean()
+        return np.sum(m[1:] * m[:-1]) / np.sum(m * m)
+    
+    
+    def _sequential_step(self):
+        for _ in range(self.N * self.N):
+            i, j = self.rng.integers(0, self.N, size=2)
+            delta_E = 2 * self.grid[i, j] * (
+                self.grid[(i + 1) % self.N, j] + self.grid[(i - 1) % self.N, j] +
+                self.grid[i, (j + 1) % self.N] + self.grid[i, (j - 1) % self.N]
+            )
+            
+            if delta_E < 0 or self.rng.uniform() < np.exp(-self.beta * delta_E):
+                self.total_energy += int(delta_E)
+                self.total_spin -= 2 * int(self.grid[i, j])
+                self.grid[i, j] *= -1
+
+    
+    def _structure_factor_shells(self):
+        """Fourier phases of the wave vectors q = 2 pi (kx, ky) / N in the lowest structure_shells shells |q| / q_min,
+        so the structure factor is computed at only these wave vectors instead of with a full FFT.
+        Only ky >= 0 is computed, the wave vectors with ky < 0 have the same |FFT|^2 and are accounted for by the weights.
+        """
+        shells = self.structure_shells
+        kx, ky, x = np.arange(-shells, shells + 1), np.arange(shells + 1), np.arange(self.N)
+        self.row_phases = np.exp(-2j * np.pi * np.outer(kx, x) / self.N)
+        # Two real matrix products with the grid are faster than a complex one
+        column_phases = np.exp(-2j * np.pi * np.outer(x, ky) / self.N)
+        self.column_cos, self.column_sin = column_phases.real.copy(), column_phases.imag.copy()
+        
+        shell = np.rint(np.hypot(kx[:, None], ky[None, :])).astype(int)
+        # Shell 0 and the wave vectors beyond the last shell go to an extra bin, which is dropped
+        self.shells = np.where((shell >= 1) & (shell <= shells), shell - 1, shells).ravel()
+        self.shell_weights = np.broadcast_to(np.where(ky == 0, 1., 2.), shell.shape).ravel()
+        self.shell_counts = np.bincount(self.shells, weights=self.shell_weights)[:shells]
+        self.q_shells = 2 * np.pi / self.N * np.arange(1, shells + 1)
+        # The fit is a least squares line through (q^2, 1 / S), of which the q^2 terms are fixed
+        self.q_squared_mean = np.mean(self.q_shells**2)
+        self.fit_weights = self.q_shells**2 - self.q_squared_mean
+        self.fit_weights /= np.dot(self.fit_weights, self.fit_weights)
+    
+    
+    def _measure_structure_factor(self):
+        """Radially averaged structure factor S(q) = |FFT(s)|^2 / N^2 at the lowest non-zero wave numbers, and the correlation length
+        from an Ornstein-Zernike fit 1 / S(q) = (1 + xi^2 q^2) / chi to them. S(0) is left out, as below the critical temperature
+        it is dominated by the magnetization. S of a single configuration fluctuates strongly, so the fit uses the average
+        over the last structure_window measurements, kept as a running sum. xi is NaN when the fit has no positive solution,
+        e.g. deep in the ordered phase.
+        """
+        grid = self.grid.astype(np.float64)
+        fourier = self.row_phases @ (grid @ self.column_cos + 1j * (grid @ self.column_sin))
+        power = np.bincount(self.shells, weights=self.shell_weights * np.abs(fourier.ravel())**2)[:self.structure_shells]
+        self.structure_factor = (self.q_shells, power / self.shell_counts / self.N**2)
+        
+        if len(self.structure_samples) == self.structure_window:
+            self.structure_sum = self.structure_sum - self.structure_samples[0]
+        self.structure_samples.append(self.structure_factor[1])
+        self.structure_sum = self.structure_sum + self.structure_factor[1]
+        y = len(self.structure_samples) / self.structure_sum
+        slope = np.dot(self.fit_weights, y)
+        intercept = y.sum() / y.size - slope * self.q_squared_mean
+        self.correlation_length.append(np.sqrt(slope / intercept) if slope > 0 and intercept > 0 else np.nan)
+    
+    
+    def state(self):
+        return {
+            "grid": self.grid, "magnetization": self.magnetization[-1], "energy": self.energy[-1],
+            "correlation_length": self.correlation_length[-1], "autocorrelation": self._autocorrelation(),
+        }
+    
+    
+    def checkpoint(self, window=100):
+        """Copy of everything that changes during the simulation, enough to continue it exactly with restore().
+        Only the last window entries of the time series are included, so checkpoints do not grow with the number of steps.
+        That covers the windows of _autocorrelation and _measure_structure_factor, so state() continues exactly as well.
+        """
+        series = {name: list(getattr(self, name))[-window:] for name in ("magnetization", "energy", "correlation_length", "structure_samples")}
+        return {
+            "grid": self.grid.copy(), "rng": self.rng.bit_generator.state, "total_energy": self.total_energy, "total_spin": self.total_spin,
+            "steps_done": self.steps_done, "wolff_clusters": self.wolff_clusters, "wolff_flipped": self.wolff_flipped, **series,
+            "structure_sum": self.structure_sum.copy(),
+        }
+    
+    
+    def restore(self, checkpoint):
+        """Continue from a checkpoint. The simulation must be initialized with the same parameters."""
+        self.grid = checkpoint["grid"].copy()
+        self.rng.bit_generator.state = checkpoint["rng"]
+        self.total_energy = checkpoint["total_energy"]
+        self.total_spin = checkpoint["total_spin"]
+        self.steps_done = checkpoint["steps_done"]
+        self.wolff_clusters = checkpoint["wolff_clusters"]
+        self.wolff_flipped = checkpoint["wolff_flipped"]
+        for name in ("magnetization", "energy", "correlation_length"):
+            setattr(self, name, deque(checkpoint[name], maxlen=self.series_length))
+        self.structure_samples = deque(checkpoint["structure_samples"], maxlen=self.structure_window)
+        self.structure_sum = checkpoint["structure_sum"].copy()
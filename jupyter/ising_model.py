@@ -1,11 +1,13 @@
+import time
 import streamlit as st
 import numpy as np
 import matplotlib.pyplot as plt
-import time
+from rendering import FrameRenderer, FigureRenderer, history_controls, play_history, session_history
+from ising_core import IsingSimulation
 
-class IsingModel():
-    def __init__(self):
-        pass
+class IsingModel(IsingSimulation):
+    # Seconds between redraws of the time series panel while animating
+    series_interval = 1.
     
     
     def _streamlit_setup(self):
@@ -16,44 +18,57 @@ class IsingModel():
         self.N = st.sidebar.slider("Grid Size (N)", min_value=10, max_value=100, value=50, step=10)
         self.temperature = st.sidebar.slider("Temperature (T)", min_value=0.1, max_value=5.0, value=2.0, step=0.1)
         self.time_steps = st.sidebar.number_input("Time steps", min_value=1, max_value=1000, value=100, step=10)
-
-        self.beta = 1. / self.temperature
-    
+        self.update_method = st.sidebar.selectbox("Update method", ("Checkerboard", "Sequential", "Wolff cluster"))
+        self.structure_interval = st.sidebar.slider("Steps per correlation length measurement", min_value=1, max_value=100, value=10)
     
-    def _initialize_grid(self):
-        # Create an NxN grid with spins randomly set to +1 or -1
-        self.grid = np.random.choice([-1, 1], size=(self.N, self.N))
-
     
-    def _ising_step(self):
-        for _ in range(self.N * self.N):
-            i, j = np.random.randint(0, self.N, size=2)
-            delta_E = 2 * self.grid[i, j] * (
-                self.grid[(i + 1) % self.N, j] + self.grid[(i - 1) % self.N, j] +
-                self.grid[i, (j + 1) % self.N] + self.grid[i, (j - 1) % self.N]
-            )
-            
-            if delta_E < 0 or np.random.rand() < np.exp(-self.beta * delta_E):
-                self.grid[i, j] *= -1
-        
-        
     def _initial_image(self):
-        self.plot_placeholder = st.empty()
-
-        # Display initial grid state
-        self.fig, self.ax = plt.subplots(figsize=(6, 6))
-        self.img = self.ax.imshow(self.grid, cmap='coolwarm', interpolation='nearest')
-        self.ax.set_xticks([])
-        self.ax.set_yticks([])
-        self.ax.set_title("Initial State", fontsize=10)
-        self.plot_placeholder.pyplot(self.fig)
+        # Spins -1 and +1 get the two ends of the coolwarm colour map
+        colors = [plt.cm.coolwarm(0.), plt.cm.coolwarm(0.5), plt.cm.coolwarm(1.)]
+        col_grid, col_series = st.columns(2)
+        self.renderer = FrameRenderer(col_grid.empty(), colors, offset=-1)
+        self.renderer.render(self.grid, caption="Initial State")
+        
+        # Time series of the observables next to the lattice
+        self.series_renderer = FigureRenderer(col_series.empty(), figsize=(6, 6), nrows=2)
+        self.series_renderer.render(lambda axes: self._draw_series(axes, *self._series()))
+        self.series_rendered_at = time.perf_counter()
+    
+    
+    def _series(self):
+        # Copies, as the series drop their oldest entries while the simulation runs
+        return self.steps_done, list(self.energy), list(self.magnetization), list(self.correlation_length)
+    
+    
+    def _draw_series(self, axes, steps_done, energy, magnetization, correlation_length):
+        """Plot the kept entries of the observable time series, which end at step steps_done.
+        They start later than step 0 after series_length steps, or after resuming a run.
+        """
+        steps = np.arange(steps_done - len(energy) + 1, steps_done + 1)
+        axes[0].plot(steps, energy, label="Energy per spin")
+        axes[0].plot(steps, magnetization, label="|Magnetization| per spin")
+        axes[0].set(xlabel="Step", ylim=(-2.05, 1.05))
+        axes[0].legend(loc="lower left", fontsize=8)
+        last_measurement = steps_done - steps_done % self.structure_interval
+        measurements = last_measurement - self.structure_interval * np.arange(len(correlation_length))[::-1]
+        axes[1].plot(measurements, correlation_length, ".-")
+        axes[1].set(xlabel="Step", ylabel="Correlation length")
+        self.series_renderer.fig.tight_layout()
                 
                 
-    def _append_fig(self, step):
-        self.img.set_data(self.grid)
-        self.ax.set_title(f"Step {step + 1}", fontsize=10)
-        self.plot_placeholder.pyplot(self.fig)
-        time.sleep(0.05)
+    def _snapshot(self):
+        # Taken on the simulation thread, so the frame does not change while it is drawn
+        return self.grid.copy(), self._autocorrelation(), self._series()
+    
+    
+    def _append_fig(self, step, snapshot):
+        grid, autocorrelation, series = snapshot
+        caption = f"Step {step + 1}, autocorrelation per step {autocorrelation:.2f}, render {self.renderer.last_render_ms():.1f} ms"
+        self.renderer.render(grid, caption=caption)
+        # Drawing the time series with matplotlib takes a few hundred ms, so it is redrawn less often than the lattice
+        if time.perf_counter() - self.series_rendered_at >= self.series_interval:
+            self.series_renderer.render(lambda axes: self._draw_series(axes, *series))
+            self.series_rendered_at = time.perf_counter()
         
         
     def animate(self):
@@ -61,8 +76,14 @@ class IsingModel():
         self._initialize_grid()
         self._initial_image()
         
-        # Create animation
-        if st.button("Play"):
-            for i in range(self.time_steps):
-                self._ising_step()
-                self._append_fig(i)
\ No newline at end of file
+        # The history of the last run with the same parameters in this session is kept on disk, and survives reruns
+        parameters = {"N": self.N, "temperature": self.temperature, "update_method": self.update_method}
+        self.history = session_history("Ising", parameters, self.grid.shape, np.int8)
+        show = lambda step, grid: self.renderer.render(grid, caption=f"Recorded step {step}")
+        action = history_controls(self.history, show)
+        
+        # Every sweep is a frame. Frames are skipped if the simulation is faster than 20 frames per second
+        if play_history(action, self.history, self, lambda: self.grid, self._ising_step, self._snapshot, self._append_fig, show,
+                        self.time_steps, fps=20):
+            self.series_renderer.render(lambda axes: self._draw_series(axes, *self._series()))
+        self.series_renderer.close()
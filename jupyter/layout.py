@@ -0,0 +1,104 @@
+import time
+import numpy as np
+
+
+class IncrementalLayout:
+    def __init__(self, iterations=10, time_budget=0.05, initial_iterations=100, initial_time_budget=0.5, seed=42):
+        """Force-directed (Fruchterman-Reingold) node positions that are kept from one frame to the next.
+        The first layout relaxes all nodes. Afterwards only new nodes and the endpoints of added or removed edges
+        move, for at most iterations steps, so the rest of the drawing stays where it was.
+        Relaxing stops early once time_budget seconds are used, which bounds the layout time per frame.
+        """
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.initial_iterations = initial_iterations
+        self.initial_time_budget = initial_time_budget
+        self.rng = np.random.default_rng(seed)
+        self.index = {}  # Node -> row in positions
+        self.positions = np.zeros((0, 2))
+        self.edges = set()
+        self.layout_times = []
+
+
+    def layout(self, nodes, edges):
+        """Positions {node: (x, y)} of the given nodes. Edges are (u, v) pairs and their direction is ignored."""
+        start = time.perf_counter()
+        nodes = list(nodes)
+        edges = {(u, v) if u <= v else (v, u) for u, v in edges if u != v}
+        first_layout = not self.index
+
+        # Keep the positions of known nodes
+        index = {node: i for i, node in enumerate(nodes)}
+        positions = np.zeros((len(nodes), 2))
+        known = np.array([node in self.index for node in nodes], dtype=bool)
+        positions[known] = self.positions[[self.index[node] for node in nodes if node in self.index]]
+        edge_array = np.array([(index[u], index[v]) for u, v in edges], dtype=int).reshape(-1, 2)
+        self._place_new_nodes(positions, edge_array, known)
+
+        # Only nodes whose connections changed are relaxed
+        moving = ~known
+        changed_edges = [(index[u], index[v]) for u, v in edges ^ self.edges if u in index and v in index]
+        moving[np.array(changed_edges, dtype=int).ravel()] = True
+        if first_layout:
+            moving[:] = True
+
+        iterations = self.initial_iterations if first_layout else self.iterations
+        time_budget = self.initial_time_budget if first_layout else self.time_budget
+        if moving.any():
+            self._relax(positions, edge_array, np.flatnonzero(moving), iterations, start + time_budget)
+
+        self.index, self.positions, self.edges = index, positions, edges
+        self.layout_times.append(time.perf_counter() - start)
+        return {node: positions[i] for node, i in index.items()}
+
+
+    def _place_new_nodes(self, positions, edges, known):
+        """Put new nodes at the mean position of their known neighbours, or at a random spot if they have none."""
+        total = np.zeros_like(positions)
+        count = np.zeros(len(positions))
+        for a, b in ((0, 1), (1, 0)):
+            attach = ~known[edges[:, a]] & known[edges[:, b]]
+            np.add.at(total, edges[attach, a], positions[edges[attach, b]])
+            np.add.at(count, edges[attach, a], 1)
+
+        new = np.flatnonzero(~known)
+        has_neighbours = count[new] > 0
+        low, high = (positions[known].min(axis=0), positions[known].max(axis=0)) if known.any() else (np.zeros(2), np.ones(2))
+        scale = 0.05 * max(np.max(high - low), 1e-3)
+        jitter = self.rng.normal(scale=scale, size=(new.size, 2))
+        positions[new] = np.where(
+            has_neighbours[:, None], total[new] / np.maximum(count[new], 1)[:, None], self.rng.uniform(low, high, size=(new.size, 2)),
+        ) + jitter
+
+
+    def _relax(self, positions, edges, moving, iterations, deadline):
+        """Move the given nodes along the spring forces, with all node pairs repelling and edges attracting."""
+        k = 1 / np.sqrt(len(positions))  # Preferred edge length
+        temperature = 0.1 if len(moving) == len(positions) else 0.2 * k  # Largest step, small once a layout exists
+
+        # Attraction only matters for edges with a moving endpoint
+        row = np.full(len(positions), -1)
+        row[moving] = np.arange(len(moving))
+        edges = edges[(row[edges[:, 0]] >= 0) | (row[edges[:, 1]] >= 0)]
+        rows = row[edges]
+
+        for _ in range(iterations):
+            if time.perf_counter() > deadline:
+                break
+            delta = positions[moving, None, :] - positions[None, :, :]
+            distance = np.maximum(np.linalg.norm(delta, axis=-1), 0.01)
+            force = np.einsum("mnd,mn->md", delta, k * k / distance**2)
+
+            edge_delta = positions[edges[:, 0]] - positions[edges[:, 1]]
+            pull = edge_delta * np.linalg.norm(edge_delta, axis=1, keepdims=True) / k
+            for endpoint, sign in ((0, -1), (1, 1)):
+                has_row = rows[:, endpoint] >= 0
+                np.add.at(force, rows[has_row, endpoint], sign * pull[has_row])
+
+            length = np.maximum(np.linalg.norm(force, axis=1, keepdims=True), 1e-9)
+            positions[moving] += force / length * np.minimum(length, temperature)
+            temperature *= 0.95
+
+
+    def last_layout_ms(self):
+        return 1000 * self.layout_times[-1] if self.layout_times else 0.
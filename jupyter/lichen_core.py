@@ -0,0 +1,470 @@
+import numpy as np
+import heapq
+
+
+# Neighbour offsets of the directed site pairs of the kinetic Monte Carlo mode. Direction d ^ 1 is the opposite of d
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def interface_matrix(lichen, number_of_ids):
+    """Count the borders between species on a grid with closed boundaries.
+    Entry [u, v] is the number of neighbouring site pairs where one site holds species u and the other species v.
+    Each border is counted from both sides, so the matrix is symmetric, and species IDs must be below number_of_ids.
+    """
+    # Neighbouring (source, target) pairs in both directions, keeping only borders between different species.
+    # Compact grids are widened first, so the pair index does not overflow
+    sources = np.concatenate([lichen[:, :-1].ravel(), lichen[:-1, :].ravel()]).astype(np.intp)
+    targets = np.concatenate([lichen[:, 1:].ravel(), lichen[1:, :].ravel()]).astype(np.intp)
+    border = sources != targets
+    sources, targets = sources[border], targets[border]
+    
+    pair_index = np.concatenate([sources * number_of_ids + targets, targets * number_of_ids + sources])
+    counts = np.bincount(pair_index, minlength=number_of_ids * number_of_ids)
+    return counts.reshape(number_of_ids, number_of_ids)
+
+
+def species_counts(lichen, rows_per_chunk=256):
+    """Number of sites of every species ID up to the largest one on the grid.
+    Counted a chunk of rows at a time, since bincount widens compact grids to 64 bit integers.
+    """
+    counts = np.zeros(int(lichen.max()) + 1, dtype=int)
+    for start in range(0, lichen.shape[0], rows_per_chunk):
+        counts += np.bincount(lichen[start:start + rows_per_chunk].ravel(), minlength=counts.size)
+    return counts
+
+
+class LichenSimulation:
+    def __init__(self, L=50, alpha=0.1, gamma=0.1, time_steps=1000, refresh_rate=50, storage="Dense", tile_size=64,
+                 update_method="Random site", seed=None):
+        """Simulation core of the Lichen model, without any plotting or Streamlit code.
+        Parameters default to the sidebar defaults of LichenModel.
+        With storage="Tiles" the grid holds uint16 species IDs and invasions are only drawn on sites at a species boundary,
+        found through tiles of tile_size x tile_size sites. Meant for large grids where most of the area is covered by a few species.
+        With update_method="Kinetic Monte Carlo" only invasions that succeed are simulated, see _kmc_steps.
+        """
+        self.L = L
+        self.alpha = alpha
+        self.gamma = gamma
+        self.time_steps = time_steps
+        self.refresh_rate = refresh_rate
+        self.storage = storage
+        self.tile_size = tile_size
+        self.update_method = update_method
+        self.seed = seed
+
+    
+    def _number_of_species(self):
+        return self.number_of_species
+    
+    
+    def _initialize_grid(self):
+        """Create an LxL grid keeping track of the Lichen species. Initially, 4 species are present (including the background species 0). 
+        Also create the interaction matrix between the species, where interaction_matrix[u, v] is True if u can invade v.
+        Invasion events and species creation draw from separate random streams, so batched and single steps use the same numbers.
+        """
+        self.event_rng, self.spawn_rng = [np.random.default_rng(s) for s in np.random.SeedSequence(self.seed).spawn(2)]
+        self.spawn_probability = self.alpha * self.gamma / self.L**2
+        self.lichen = np.zeros(shape=(self.L, self.L), dtype=np.uint16 if self.storage == "Tiles" else int)
+        self.lichen[:self.L//3, :self.L //3] = 1  # Upper left corner
+        self.lichen[-self.L //3:, -self.L //3:] = 2  # Lower right corner
+        self.lichen[int(0.4 * self.L) : int(0.6 * self.L), int(0.4 * self.L) : int(0.6 * self.L)] = 3 # Center'ish
+        if self.storage == "Tiles":
+            self._tile_setup()
+        elif self.update_method != "Kinetic Monte Carlo":  # Kinetic Monte Carlo finds the neighbours itself
+            self._neighbour_lists()
+        
+        # Species IDs index the interaction matrix and the population census. IDs of dead species are reused, lowest first
+        counts = species_counts(self.lichen)
+        number_of_species = np.count_nonzero(counts)
+        self.interaction_matrix = np.zeros((32, 32), dtype=bool)
+        self.population = np.zeros(32, dtype=int)
+        self.number_of_species = 0
+        self.free_ids = []
+        self.next_id = 0
+        for _ in range(number_of_species):
+            self._allocate_species_id()
+        self.population[:number_of_species] = counts
+        
+        # Erdos-Renyi directed interactions between the initial species
+        interactions = self.spawn_rng.uniform(size=(number_of_species, number_of_species)) < self.gamma
+        np.fill_diagonal(interactions, False)
+        self.interaction_matrix[:number_of_species, :number_of_species] = interactions
+        
+        self.time = 0.  # In steps, i.e. invasion attempts of the random site dynamics
+        self.pending_waits = None  # Steps to the next invasion and spawn, carried between calls of _tiled_steps
+        self.next_event_time = None  # Time of the next event of kinetic Monte Carlo, carried between calls of _kmc_steps
+        if self.update_method == "Kinetic Monte Carlo":
+            self._kmc_setup()
+    
+    
+    def _neighbour_lists(self):
+        """For each site (flat index), the flat indices of its neighbours with closed boundaries."""
+        self.neighbours = []
+        for x in range(self.L):
+            for y in range(self.L):
+                self.neighbours.append([
+                    (x + dx) * self.L + y + dy for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                    if 0 <= x + dx < self.L and 0 <= y + dy < self.L
+                ])
+    
+    
+    def _tile_setup(self):
+        """Mark the sites at a species boundary, i.e. with a neighbour of another species, and count them per tile.
+        Only these sites can invade, so tiles without any are dormant and skipped by the invasion sampler.
+        """
+        lichen = self.lichen
+        self.boundary = np.zeros((self.L, self.L), dtype=bool)
+        horizontal = lichen[:, :-1] != lichen[:, 1:]
+        vertical = lichen[:-1, :] != lichen[1:, :]
+        self.boundary[:, :-1] |= horizontal
+        self.boundary[:, 1:] |= horizontal
+        self.boundary[:-1, :] |= vertical
+        self.boundary[1:, :] |= vertical
+        
+        # Summed one row of tiles at a time, so the mask is never widened to 64 bit integers as a whole
+        starts = np.arange(0, self.L, self.tile_size)
+        self.tile_counts = np.array([np.add.reduceat(self.boundary[start:start + self.tile_size].sum(axis=0), starts) for start in starts])
+        self.boundary_count = int(self.tile_counts.sum())
+    
+    
+    def _update_boundary(self, x, y):
+        """Update the boundary marks and tile counts of a site whose species changed, and of its neighbours."""
+        lichen = self.lichen
+        L = self.L
+        for i, j in ((x, y), (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if not (0 <= i < L and 0 <= j < L):
+                continue
+            species = lichen[i, j]
+            is_boundary = (
+                (i > 0 and lichen[i - 1, j] != species) or (i < L - 1 and lichen[i + 1, j] != species)
+                or (j > 0 and lichen[i, j - 1] != species) or (j < L - 1 and lichen[i, j + 1] != species)
+            )
+            if is_boundary != self.boundary[i, j]:
+                self.boundary[i, j] = is_boundary
+                change = 1 if is_boundary else -1
+                self.tile_counts[i // self.tile_size, j // self.tile_size] += change
+                self.boundary_count += change
+    
+    
+    def _allocate_species_id(self):
+        """Return the lowest unused species ID, growing the interaction matrix if needed."""
+        if self.free_ids:
+            species = heapq.heappop(self.free_ids)
+        else:
+            species = self.next_id
+            self.next_id += 1
+            capacity = self.population.size
+            if species == capacity:
+                interaction_matrix = np.zeros((2 * capacity, 2 * capacity), dtype=bool)
+                interaction_matrix[:capacity, :capacity] = self.interaction_matrix
+                self.interaction_matrix = interaction_matrix
+                self.population = np.concatenate([self.population, np.zeros(capacity, dtype=int)])
+        if species > np.iinfo(self.lichen.dtype).max:
+            raise OverflowError(f"More living species than fit in the {self.lichen.dtype} grid")
+        self.number_of_species += 1
+        return species
+    
+    
+    def _release_species_id(self, species):
+        """Remove a dead species and its interactions, and make its ID available for new species."""
+        self.number_of_species -= 1
+        self.interaction_matrix[species, :] = False
+        self.interaction_matrix[:, species] = False
+        heapq.heappush(self.free_ids, int(species))
+    
+    
+    def _new_species(self):
+        """Choose a random point on the grid and give it the lowest unused species ID, to ensure it is not equal to existing species' values.
+        Then connect the new species to existing species, and all existing species to it, each with probability gamma.
+        Always connect it to the species that was at the site before it spawned.            
+        """
+        # Find the site to spawn the new species on, and its value
+        x, y = self.spawn_rng.integers(low=0, high=self.L, size=2)
+        existing_species = np.flatnonzero(self.population)
+        new_species_value = self._allocate_species_id()
+        
+        # For each other species, check if both the new species can invade that species and vice versa
+        self.interaction_matrix[new_species_value, existing_species] = self.spawn_rng.uniform(size=existing_species.size) < self.gamma
+        self.interaction_matrix[existing_species, new_species_value] = self.spawn_rng.uniform(size=existing_species.size) < self.gamma
+        
+        # The species that was at the site before can always invade the new species
+        self.interaction_matrix[self.lichen[x, y], new_species_value] = True
+        
+        # Update the grid to contain the new species
+        self._set_site(x * self.L + y, new_species_value)
+    
+    
+    def _invade(self, site_draw, nbor_draw):
+        """Pick a random site and one of its neighbours from two uniform numbers in [0, 1). 
+        The neighbour lists take closed boundary conditions into account.
+        """
+        lichen = self.lichen.ravel()  # Flat view, so updates are written to the grid
+        site = min(int(site_draw * self.L**2), self.L**2 - 1)
+        possible_nbors = self.neighbours[site]
+        nbor = possible_nbors[int(nbor_draw * len(possible_nbors))]
+        
+        # Check if the picked site can invade the neighbour from the interaction matrix
+        if self.interaction_matrix[lichen[site], lichen[nbor]]:
+            self._set_site(nbor, lichen[site])
+
+
+    def _set_site(self, site, species):
+        """Change the species at a site (flat index) and update the population census.
+        Any species whose population drops to zero is removed from the interaction matrix.
+        """
+        lichen = self.lichen.ravel()
+        old_species = lichen[site]
+        lichen[site] = species
+        self.population[species] += 1
+        self.population[old_species] -= 1
+        if self.population[old_species] == 0:
+            self._release_species_id(old_species)
+        if self.storage == "Tiles":
+            self._update_boundary(*divmod(site, self.L))
+        if self.update_method == "Kinetic Monte Carlo":
+            self._kmc_update(*divmod(site, self.L))
+
+    
+    def interface_matrix(self):
+        """Border counts between all pairs of species IDs on the current grid, see interface_matrix.
+        Combined with the interaction matrix, entry [u, v] > 0 means u is actively invading v.
+        """
+        return interface_matrix(self.lichen, self.population.size)
+    
+    
+    def _lichen_step(self):
+        """In each time step, pick a random site and a neighbour. If the chosen site can invade the neighbour, it does so.
+        Also pick a random site with probability alpha * gamma / L**2 to create a new species on.
+        """
+        if self.update_method == "Kinetic Monte Carlo":
+            self._kmc_steps(1)
+            return
+        self.time += 1
+        if self.storage == "Tiles":
+            self._tiled_steps(1)
+            return
+        site_draw, nbor_draw, spawn_draw = self.event_rng.uniform(size=3)
+        self._invade(site_draw, nbor_draw)
+        if spawn_draw < self.spawn_probability:
+            self._new_species()
+    
+    
+    def _lichen_steps(self, number_of_steps):
+        """Perform number_of_steps time steps, drawing the random numbers of all steps at once. 
+        Uses the same random numbers in the same order as repeated _lichen_step calls, so the result is identical for a given seed.
+        """
+        if self.update_method == "Kinetic Monte Carlo":
+            self._kmc_steps(number_of_steps)
+            return
+        self.time += number_of_steps
+        if self.storage == "Tiles":
+            self._tiled_steps(number_of_steps)
+            return
+        draws = self.event_rng.uniform(size=(number_of_steps, 3))
+        sites = np.minimum((draws[:, 0] * self.L**2).astype(int), self.L**2 - 1).tolist()
+        nbor_draws = draws[:, 1].tolist()
+        spawn_steps = set(np.flatnonzero(draws[:, 2] < self.spawn_probability).tolist())
+        
+        lichen = self.lichen.ravel()
+        neighbours = self.neighbours
+        interaction_matrix = self.interaction_matrix
+        for step in range(number_of_steps):
+            site = sites[step]
+            possible_nbors = neighbours[site]
+            nbor = possible_nbors[int(nbor_draws[step] * len(possible_nbors))]
+            species = lichen[site]
+            if interaction_matrix[species, lichen[nbor]]:
+                self._set_site(nbor, species)
+            
+            if step in spawn_steps:
+                self._new_species()
+                interaction_matrix = self.interaction_matrix  # May have grown
+    
+    
+    def _tiled_steps(self, number_of_steps):
+        """Perform number_of_steps time steps of the same dynamics, skipping the steps that cannot change anything.
+        A step only matters if its site is at a species boundary, which happens with probability boundary_count / L**2,
+        or if it spawns a species, with probability spawn_probability. Both are independent per step, so the number of steps
+        until the next one of each is geometric. The waiting times are memoryless, so they are drawn anew after every event.
+        The waits left at the end of a call are kept in pending_waits for the next call, so the result does not depend
+        on how the steps are split into calls.
+        """
+        remaining = number_of_steps
+        while True:
+            if self.pending_waits is not None:
+                to_invasion, to_spawn = self.pending_waits
+                self.pending_waits = None
+            else:
+                to_invasion = self.event_rng.geometric(self.boundary_count / self.L**2) if self.boundary_count else np.inf
+                to_spawn = self.event_rng.geometric(self.spawn_probability) if self.spawn_probability > 0 else np.inf
+            steps = min(to_invasion, to_spawn)
+            if steps > remaining:
+                self.pending_waits = (to_invasion - remaining, to_spawn - remaining)
+                break
+            remaining -= steps
+            # Within the same step the invasion comes first, as in _lichen_step
+            if to_invasion == steps:
+                self._invade_boundary()
+            if to_spawn == steps:
+                self._new_species()
+    
+    
+    def _invade_boundary(self):
+        """Invasion attempt from a uniformly drawn boundary site: pick a tile by its number of boundary sites, then the site within it."""
+        site_draw, nbor_draw = self.event_rng.uniform(size=2)
+        index = min(int(site_draw * self.boundary_count), self.boundary_count - 1)
+        cumulative = np.cumsum(self.tile_counts.ravel())
+        tile = int(np.searchsorted(cumulative, index, side="right"))
+        index -= int(cumulative[tile]) - int(self.tile_counts.flat[tile])
+        
+        T = self.tile_size
+        tile_x, tile_y = divmod(tile, self.tile_counts.shape[1])
+        tile_boundary = self.boundary[tile_x * T:(tile_x + 1) * T, tile_y * T:(tile_y + 1) * T]
+        dx, dy = divmod(int(np.flatnonzero(tile_boundary)[index]), tile_boundary.shape[1])
+        x, y = tile_x * T + dx, tile_y * T + dy
+        
+        possible_nbors = [(x + i, y + j) for i, j in ((-1, 0), (1, 0), (0, -1), (0, 1)) if 0 <= x + i < self.L and 0 <= y + j < self.L]
+        nbor_x, nbor_y = possible_nbors[int(nbor_draw * len(possible_nbors))]
+        species = self.lichen[x, y]
+        if self.interaction_matrix[species, self.lichen[nbor_x, nbor_y]]:
+            self._set_site(nbor_x * self.L + nbor_y, species)
+    
+    
+    def _kmc_setup(self):
+        """Collect the active directed pairs (site, neighbour), where the species at the site can invade the one at the neighbour.
+        In the random site dynamics a pair is picked with probability 1 / (L**2 * degree of the site) per step,
+        so the pairs are kept in one bucket per degree, where all pairs are equally likely.
+        A pair is stored as 4 * site + direction, and pair_positions holds its index in its bucket, or -1 if it is inactive.
+        """
+        L = self.L
+        sites = np.arange(L * L).reshape(L, L)
+        degree = np.full((L, L), 4)
+        degree[[0, -1], :] -= 1
+        degree[:, [0, -1]] -= 1
+        
+        self.pair_buckets = {2: [], 3: [], 4: []}
+        self.pair_positions = np.full(4 * L * L, -1, dtype=np.int32)
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            # Slices of the sites that have a neighbour in this direction, and of those neighbours
+            source = (slice(max(-dx, 0), L - max(dx, 0)), slice(max(-dy, 0), L - max(dy, 0)))
+            target = (slice(max(dx, 0), L - max(-dx, 0)), slice(max(dy, 0), L - max(-dy, 0)))
+            active = self.interaction_matrix[self.lichen[source], self.lichen[target]]
+            for d, bucket in self.pair_buckets.items():
+                pairs = 4 * sites[source][active & (degree[source] == d)] + direction
+                self.pair_positions[pairs] = np.arange(len(bucket), len(bucket) + pairs.size)
+                bucket.extend(pairs.tolist())
+    
+    
+    def _kmc_update(self, x, y):
+        """Update the active pairs from and to a site whose species changed."""
+        L = self.L
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            nbor_x, nbor_y = x + dx, y + dy
+            if 0 <= nbor_x < L and 0 <= nbor_y < L:
+                self._kmc_set_pair(x, y, direction, nbor_x, nbor_y)
+                self._kmc_set_pair(nbor_x, nbor_y, direction ^ 1, x, y)
+    
+    
+    def _kmc_set_pair(self, x, y, direction, nbor_x, nbor_y):
+        pair = 4 * (x * self.L + y) + direction
+        active = self.interaction_matrix[self.lichen[x, y], self.lichen[nbor_x, nbor_y]]
+        position = self.pair_positions[pair]
+        if active == (position >= 0):
+            return
+        bucket = self.pair_buckets[4 - (x == 0) - (x == self.L - 1) - (y == 0) - (y == self.L - 1)]
+        if active:
+            self.pair_positions[pair] = len(bucket)
+            bucket.append(pair)
+        else:
+            # Move the last pair of the bucket into the hole
+            last = bucket.pop()
+            if last != pair:
+                bucket[position] = last
+                self.pair_positions[last] = position
+            self.pair_positions[pair] = -1
+    
+    
+    def _kmc_steps(self, number_of_steps):
+        """Advance the clock by number_of_steps steps with the n-fold way: only successful invasions and spawns are simulated.
+        Per step, invasions happen at rate sum over degrees of (active pairs of that degree) / (L**2 * degree)
+        and spawns at rate spawn_probability. The time to the next event is exponential with the total rate,
+        the continuous time version of the geometric number of steps between events. Rates change with every event,
+        so the waiting time is drawn anew each time. An event after the end of the interval is kept in next_event_time
+        for the next call, so the result does not depend on how the steps are split into calls.
+        """
+        end = self.time + number_of_steps
+        while True:
+            rates = [len(bucket) / (self.L**2 * d) for d, bucket in self.pair_buckets.items()]
+            total_rate = sum(rates) + self.spawn_probability
+            if self.next_event_time is None:
+                if total_rate == 0:
+                    break
+                self.next_event_time = self.time + self.event_rng.exponential(1 / total_rate)
+            if self.next_event_time > end:
+                break
+            self.time = self.next_event_time
+            self.next_event_time = None
+            
+            draw = self.event_rng.uniform() * total_rate
+            # Falls through to the last non-empty bucket if rounding makes the draw exceed the summed rates
+            buckets = [(rate, bucket) for rate, bucket in zip(rates, self.pair_buckets.values()) if bucket]
+            if draw < self.spawn_probability or not buckets:
+                self._new_species()
+                continue
+            draw -= self.spawn_probability
+            for rate, bucket in buckets:
+                if draw < rate:
+                    break
+                draw -= rate
+            # Within a bucket all pairs are equally likely, and the remaining draw is uniform in [0, rate)
+            pair = bucket[min(int(draw / rate * len(bucket)), len(bucket) - 1)]
+            site, direction = divmod(pair, 4)
+            x, y = divmod(site, self.L)
+            dx, dy = DIRECTIONS[direction]
+            self._set_site((x + dx) * self.L + y + dy, self.lichen[x, y])
+        self.time = end
+    
+    
+    def state(self):
+        return {"lichen": self.lichen, "number_of_species": self.number_of_species, "population": self.population}
+    
+    
+    def checkpoint(self):
+        """Copy of everything that changes during the simulation, enough to continue it exactly with restore().
+        Besides the grid and the random streams, this is the interaction network and the species ID bookkeeping.
+        With tile storage it also includes the pending waits to the next events.
+        With kinetic Monte Carlo it includes the active pairs, as the random draws depend on their order within the buckets,
+        and the time of the next event.
+        """
+        checkpoint = {
+            "lichen": self.lichen.copy(), "interaction_matrix": self.interaction_matrix.copy(), "population": self.population.copy(),
+            "number_of_species": self.number_of_species, "free_ids": list(self.free_ids), "next_id": self.next_id,
+            "event_rng": self.event_rng.bit_generator.state, "spawn_rng": self.spawn_rng.bit_generator.state, "time": self.time,
+        }
+        if self.storage == "Tiles":
+            checkpoint["pending_waits"] = self.pending_waits
+        if self.update_method == "Kinetic Monte Carlo":
+            checkpoint["pair_buckets"] = {d: list(bucket) for d, bucket in self.pair_buckets.items()}
+            checkpoint["pair_positions"] = self.pair_positions.copy()
+            checkpoint["next_event_time"] = self.next_event_time
+        return checkpoint
+    
+    
+    def restore(self, checkpoint):
+        """Continue from a checkpoint. The simulation must be initialized with the same parameters."""
+        self.lichen = checkpoint["lichen"].copy()
+        self.interaction_matrix = checkpoint["interaction_matrix"].copy()
+        self.population = checkpoint["population"].copy()
+        self.number_of_species = checkpoint["number_of_species"]
+        self.free_ids = list(checkpoint["free_ids"])
+        self.next_id = checkpoint["next_id"]
+        self.event_rng.bit_generator.state = checkpoint["event_rng"]
+        self.spawn_rng.bit_generator.state = checkpoint["spawn_rng"]
+        self.time = checkpoint["time"]
+        if self.storage == "Tiles":
+            self._tile_setup()
+            self.pending_waits = checkpoint["pending_waits"]
+        if self.update_method == "Kinetic Monte Carlo":
+            self.pair_buckets = {d: list(bucket) for d, bucket in checkpoint["pair_buckets"].items()}
+            self.pair_positions = checkpoint["pair_positions"].copy()
+            self.next_event_time = checkpoint["next_event_time"]
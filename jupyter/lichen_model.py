@@ -3,11 +3,16 @@ import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from rendering import FrameRenderer, FigureRenderer, history_controls, play_history, session_history
+from layout import IncrementalLayout
+from lichen_core import LichenSimulation, interface_matrix
 
 
-class LichenModel:
-    def __init__(self):
-        self.node_positions = None  # To store fixed positions of nodes
+class LichenModel(LichenSimulation):
+    def __init__(self, **parameters):
+        super().__init__(**parameters)
+        self.node_positions = None
+        self.layout = IncrementalLayout()  # Keeps the positions of nodes between frames
         self.color_list = [mcolors.to_hex(color) for color in plt.cm.tab20.colors]
 
     
@@ -15,169 +20,77 @@ class LichenModel:
         st.header("Lichen Model")
         st.sidebar.header("Lichen Model Parameters")
         
-        self.L = st.sidebar.slider("Grid Size (L)", min_value=10, max_value=200, value=50, step=10)
+        # Tiled storage and kinetic Monte Carlo skip the invasion attempts that do nothing, so they can handle much larger grids
+        self.storage = st.sidebar.selectbox("Storage", ("Dense", "Tiles"))
+        self.update_method = st.sidebar.selectbox("Update method", ("Random site", "Kinetic Monte Carlo"))
+        large = self.storage == "Tiles" or self.update_method == "Kinetic Monte Carlo"
+        self.L = st.sidebar.slider("Grid Size (L)", min_value=10, max_value=1000 if large else 200, value=50, step=10)
         self.alpha = st.sidebar.slider("Evolve rate", min_value=0.0, max_value=1.0, value=0.1, step=0.025)
         self.gamma = st.sidebar.slider("Interaction probability", min_value=0.0, max_value=1.0, value=0.1, step=0.025)
         self.time_steps = st.sidebar.number_input("Time steps", min_value=1, max_value=10_0000, value=1000, step=10)
         self.refresh_rate = st.sidebar.slider("Steps per update", min_value=1, max_value=1000, value=50, step=10)
     
     
-    def _number_of_species(self):
-        return np.unique(self.lichen).size
-    
-    
     def _initialize_grid(self):
-        """Create an LxL grid keeping track of the Lichen species. Initially, 5 species are present. 
-        Also create the interaction network between the species.
-        """
-        self.lichen = np.zeros(shape=(self.L, self.L), dtype=int)
-        self.lichen[:self.L//3, :self.L //3] = 1  # Upper left corner
-        self.lichen[-self.L //3:, -self.L //3:] = 2  # Lower right corner
-        self.lichen[int(0.4 * self.L) : int(0.6 * self.L), int(0.4 * self.L) : int(0.6 * self.L)] = 3 # Center'ish
-        self.interaction_network = nx.erdos_renyi_graph(n=self._number_of_species(), p=self.gamma, directed=True)
-        self.node_positions = nx.arf_layout(self.interaction_network, seed=42)  # Initialize node positions
-        
-        self.next_species_value = self._get_next_species_value()
+        super()._initialize_grid()
+        self.node_positions = None
+        self.layout = IncrementalLayout()
     
     
-    def _get_next_species_value(self):
-        """Next species value is either 1 plus the current max valued species, or the lowest number between the min and the max value.
-        This allows species values to be reused if a species is dead.
+    def _interaction_graph(self, interaction_matrix, population):
+        """Build the networkx interaction network of the living species from an interaction matrix. 
+        Only used for drawing. Species that were already drawn keep their positions, 
+        and only new species and species whose interactions changed are moved.
         """
-        all_values = np.arange(0, np.max(self.lichen)+2)  # +1 to include the max value, another +1 to include the next value
-        possible_values_idx = np.isin(all_values, np.unique(self.lichen), invert=True, assume_unique=True)
-        possible_values = all_values[possible_values_idx]        
-        return np.min(possible_values)
-    
-    
-    def _new_species(self):
-        """With probability alpha * gamma / L**2, choose a random point on the grid.
-        The point is given a value of the number of species, to ensure it is not equal to existing species' values.
-        Then create a new node in the interaction network and potentially connect it to existing nodes, and all existing nodes to it.
-        Always connect it to the node of the species that was at the site before it spawned.            
-        """
-        if np.random.uniform() < self.alpha * self.gamma / self.L**2:
-            # Find the site to spawn the new species on, and its value
-            x, y = np.random.randint(low=0, high=self.L, size=2)
-            new_species_value = self._get_next_species_value()
-
-            # Add the new species to the interaction network and connect it to the species that was at the site before it spawned
-            self.interaction_network.add_node(new_species_value)            
-            self.interaction_network.add_edge(self.lichen[x, y], new_species_value)
-            
-            # Update the grid to contain the new species
-            self.lichen[x, y] = new_species_value
-            
-            # For each other species, check if both the new species can invade that species and vice versa
-            for node in self.interaction_network.nodes():
-                if node != new_species_value:  # Avoid self-loop
-                    if np.random.uniform() < self.gamma:
-                        self.interaction_network.add_edge(new_species_value, node)
-                    if np.random.uniform() < self.gamma:
-                        self.interaction_network.add_edge(node, new_species_value)
-            
-            # Update positions to include the new node
-            self.node_positions = nx.arf_layout(self.interaction_network, pos=self.node_positions, seed=42)# fixed=list(self.node_positions.keys()), seed=42)
-    
+        species = np.flatnonzero(population)
+        self.interaction_network = nx.DiGraph()
+        self.interaction_network.add_nodes_from(species.tolist())
+        sources, targets = np.nonzero(interaction_matrix[np.ix_(species, species)])
+        self.interaction_network.add_edges_from(zip(species[sources].tolist(), species[targets].tolist()))
+        self.node_positions = self.layout.layout(self.interaction_network.nodes, self.interaction_network.edges)
+        
     
-    def _get_neighbors(self, x, y):
-        neighbors = []
-        if x > 0:
-            neighbors.append((x - 1, y))
-        if x < self.L - 1:
-            neighbors.append((x + 1, y))
-        if y > 0:
-            neighbors.append((x, y - 1))
-        if y < self.L - 1:
-            neighbors.append((x, y + 1))
-        return neighbors
-
+    def _species_colors(self, number_of_ids):
+        """Colour of every species ID, cycling through the colour list. The same colours are used in the grid and the network."""
+        return [self.color_list[species % len(self.color_list)] for species in range(number_of_ids)]
     
-    def _invade(self):
-        # Pick random site and one of its neighbours.
-        idx_picked = np.random.randint(low=0, high=self.L, size=2)
-        x, y = idx_picked
-        # The neighbour must take closed boundary conditions into account
-        possible_nbors = self._get_neighbors(x, y)
-        x_nbor, y_nbor = possible_nbors[np.random.randint(low=0, high=len(possible_nbors))]
-        
-        # Check if the picked site can invade the neighbour from interaction_network
-        if self.interaction_network.has_edge(self.lichen[x, y], self.lichen[x_nbor, y_nbor]):
-            self.lichen[x_nbor, y_nbor] = self.lichen[x, y]
-
-
-    def _remove_dead_species(self):
-        """Any species that has no values on the grid should be removed from the interaction network.
-        """
-        for node in list(self.interaction_network.nodes()):
-            if np.sum(self.lichen == node) == 0:
-                self.interaction_network.remove_node(node)
-
     
-    def _lichen_step(self):
-        """In each time step, pick a random site and a neighbour. If the chosen site can invade the neighbour, it does so.
-        Also pick a random site with probability alpha * gamma / N to create a new species on.
-        """
-        self._invade()
-        self._new_species()
-        self._remove_dead_species()
-        
-
-    def _current_list_of_colors(self):
-        current_list_of_colors = []
-        for node in self.interaction_network.nodes():
-            current_list_of_colors.append(self.color_list[node])
-
-        return current_list_of_colors
+    def _snapshot(self):
+        # Taken on the simulation thread, so the frame does not change while it is drawn
+        return self.lichen.copy(), self.interaction_matrix.copy(), self.population.copy()
     
     
     def _initial_image(self):
-        self.plot_placeholder = st.empty()
-
-        # Display initial grid state
-        self.fig, (self.ax1, self.ax2) = plt.subplots(1, 2, figsize=(12, 6))
-        current_list_of_colors = self._current_list_of_colors()        
-        cmap = mcolors.ListedColormap(list(current_list_of_colors))
-        self.img = self.ax1.imshow(self.lichen, interpolation='nearest', cmap=cmap)
-        self.ax1.set_xticks([])
-        self.ax1.set_yticks([])
-        self.ax1.set_title("Initial State", fontsize=10)
+        col_grid, col_network = st.columns(2)
+        
+        # Display initial grid state, drawn directly from the species IDs through a colour lookup table
+        self.grid_renderer = FrameRenderer(col_grid.empty(), self._species_colors(self.population.size))
+        self.grid_renderer.render(self.lichen, caption="Initial State")
         
         # Initial network visualization
-        self._update_network_plot()
-        self.plot_placeholder.pyplot(self.fig)
+        self.network_renderer = FigureRenderer(col_network.empty())
+        self._interaction_graph(self.interaction_matrix, self.population)
+        self.network_renderer.render(lambda ax: self._update_network_plot(ax, self.lichen, self.population))
         
     
-    def _update_network_plot(self):
-        self.ax2.clear()
+    def _update_network_plot(self, ax, lichen, population):
         
         # Use fixed positions for nodes
         pos = self.node_positions
         
         # Draw nodes with colors matching the grid plot
-        species_sizes = [np.sum(self.lichen == node) * 20 for node in self.interaction_network.nodes()]
-        species_color = [self.color_list[node] for node in self.interaction_network.nodes()]
-        nx.draw_networkx_nodes(self.interaction_network, pos, ax=self.ax2, node_size=np.array(species_sizes) / self.L, node_color=species_color, edgecolors='black', linewidths=0.5, alpha=0.9)
+        species_sizes = [population[node] * 20 for node in self.interaction_network.nodes()]
+        species_color = [self.color_list[node % len(self.color_list)] for node in self.interaction_network.nodes()]
+        nx.draw_networkx_nodes(self.interaction_network, pos, ax=ax, node_size=np.array(species_sizes) / self.L, node_color=species_color, edgecolors='black', linewidths=0.5, alpha=0.9)
         
         # Draw active (green) and potential (grey) interactions
+        # Count the number of sites that border a species which the other species can invade, for all edges at once
+        interfaces = interface_matrix(lichen, population.size)
         active_edges = []
         potential_edges = []
         number_of_active_sites = []
         for u, v in self.interaction_network.edges():
-            # Both u -> v and v -> u are considered by having 1 and -1 shifts. 
-            # Count the number of sites that border a species which the other species can invade
-            # Take closed boundaries into account by making shorter lichen grids
-            lichen_no_top = self.lichen[1:, :]
-            lichen_no_bot = self.lichen[:-1, :]
-            lichen_no_left = self.lichen[:, 1:]
-            lichen_no_right = self.lichen[:, :-1]
-            
-            left_active_sites = np.count_nonzero((lichen_no_left == u) & (lichen_no_right == v))
-            right_active_sites = np.count_nonzero((lichen_no_right == u) & (lichen_no_left == v))
-            up_active_sites = np.count_nonzero((lichen_no_top == u) & (lichen_no_bot == v))
-            down_active_sites = np.count_nonzero((lichen_no_bot == u) & (lichen_no_top == v))
-            
-            all_active_sites = left_active_sites + right_active_sites + up_active_sites + down_active_sites        
+            all_active_sites = interfaces[u, v]
 
             # If there are any active sites, the interaction is active
             if all_active_sites > 0:
@@ -189,26 +102,31 @@ class LichenModel:
 
         edge_width = np.maximum(np.array(number_of_active_sites) / 4, 1)
         
-        nx.draw_networkx_edges(self.interaction_network, pos, ax=self.ax2, edgelist=active_edges, edge_color='green', width=edge_width)
-        nx.draw_networkx_edges(self.interaction_network, pos, ax=self.ax2, edgelist=potential_edges, edge_color='grey', style='dashed')
+        nx.draw_networkx_edges(self.interaction_network, pos, ax=ax, edgelist=active_edges, edge_color='green', width=edge_width)
+        nx.draw_networkx_edges(self.interaction_network, pos, ax=ax, edgelist=potential_edges, edge_color='grey', style='dashed')
         
-        self.ax2.set_title("Interaction Network", fontsize=10)
+        ax.set_title("Interaction Network", fontsize=10)
     
     
-    def _append_fig(self, step):
-        self.ax1.clear()
-        # Get the cmap
-        current_list_of_colors = self._current_list_of_colors()
-        cmap = mcolors.ListedColormap(list(current_list_of_colors))
-        # Update the grid state
-        self.ax1.imshow(self.lichen, interpolation='nearest', cmap=cmap)
-        self.ax1.set(xticks=[], yticks=[])
-        self.ax1.set_title(f"Step {step + 1}", fontsize=10)
+    def _append_fig(self, step, snapshot):
+        lichen, interaction_matrix, population = snapshot
+        
+        # Update the grid state. The colour table grows with the number of species IDs
+        if len(self.grid_renderer.table) != population.size:
+            self.grid_renderer.set_colors(self._species_colors(population.size))
+        render_ms = self.grid_renderer.last_render_ms() + self.network_renderer.last_render_ms()
+        caption = f"Step {step + 1}, render {render_ms:.1f} ms, layout {self.layout.last_layout_ms():.1f} ms"
+        self.grid_renderer.render(lichen, caption=caption)
         
         # Update the network state
-        self._update_network_plot()
+        self._interaction_graph(interaction_matrix, population)
+        self.network_renderer.render(lambda ax: self._update_network_plot(ax, lichen, population))
         
-        self.plot_placeholder.pyplot(self.fig)
+    
+    def _show_recorded(self, step, lichen):
+        if len(self.grid_renderer.table) <= lichen.max():
+            self.grid_renderer.set_colors(self._species_colors(int(lichen.max()) + 1))
+        self.grid_renderer.render(lichen, caption=f"Recorded step {step}")
         
     
     def animate(self):
@@ -216,8 +134,17 @@ class LichenModel:
         self._initialize_grid()
         self._initial_image()
         
-        if st.button("Play"):
-            for step in range(self.time_steps):
-                self._lichen_step()
-                if (step + 1) % self.refresh_rate == 0:
-                    self._append_fig(step)
+        # The grids of the last run with the same parameters in this session are kept on disk, and survive reruns.
+        # Tiles storage keeps the grid in 16 bits itself. Otherwise the lowest free species ID is reused,
+        # so IDs stay below the number of sites, and 16 bits suffice up to L = 256
+        parameters = {"L": self.L, "alpha": self.alpha, "gamma": self.gamma, "refresh_rate": self.refresh_rate, "storage": self.storage,
+                      "update_method": self.update_method}
+        dtype = np.uint16 if self.storage == "Tiles" or self.L ** 2 <= 2 ** 16 else np.uint32
+        self.history = session_history("Lichen", parameters, self.lichen.shape, dtype)
+        action = history_controls(self.history, self._show_recorded)
+        
+        # The steps between two frames run as one batch in the background. Only the grid is recorded,
+        # so the network panel is not redrawn on replay
+        play_history(action, self.history, self, lambda: self.lichen, lambda: self._lichen_steps(self.refresh_rate), self._snapshot,
+                     self._append_fig, self._show_recorded, self.time_steps // self.refresh_rate, steps_per_frame=self.refresh_rate)
+        self.network_renderer.close()
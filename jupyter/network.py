@@ -1,56 +1,75 @@
 import streamlit as st
-import networkx as nx
 import numpy as np
-import matplotlib.pyplot as plt
-import time
+import networkx as nx
+from rendering import FigureRenderer, timed_frames
+from layout import IncrementalLayout
+from network_core import ErdosRenyiNetworkSimulation, check_parameters
 
 
-class ErdosRenyiNetworkModel():
-    def __init__(self):
-        """Illustration of a simple Erdos-Renyi network model where at each time step, one edge is deleted and another is added.
-        """
-        pass
+class ErdosRenyiNetworkModel(ErdosRenyiNetworkSimulation):
+    # Larger networks are only shown through their degree distribution
+    max_drawn_nodes = 200
     
     
     def _streamlit_setup(self):
         st.header("Erdos-Renyi Network")
         st.sidebar.header("Erdos-Renyi Network Parameters")
         
-        self.N = st.sidebar.slider("Number of nodes (N)", min_value=5, max_value=100, value=50, step=5)
-        self.p = st.sidebar.slider("Edge probability (p)", min_value=0.1, max_value=1.0, value=0.5, step=0.1)
-        self.time_steps = st.sidebar.number_input("Time steps", min_value=1, max_value=1000, value=100, step=10)
-        
-        
-    def _initialize_network(self):
-        self.G = nx.erdos_renyi_graph(self.N, self.p)
-        
-    
-    def _network_step(self):
-        """Delete a random edge and add a random edge"""
-        edges = list(self.G.edges)
-        remove_edge = edges[np.random.randint(0, len(edges))]
-        self.G.remove_edge(*remove_edge)
-        
-        add_edge = (np.random.randint(0, self.N), np.random.randint(0, self.N))
-        self.G.add_edge(*add_edge)
+        self.N = st.sidebar.number_input("Number of nodes (N)", min_value=5, max_value=100_000, value=50, step=5)
+        self.p = st.sidebar.number_input("Edge probability (p)", min_value=0.0, max_value=1.0, value=0.5, step=0.05, format="%.5f")
+        self.time_steps = st.sidebar.number_input("Time steps", min_value=1, max_value=1_000_000, value=100, step=10)
+        self.steps_per_frame = st.sidebar.number_input("Steps per frame", min_value=1, max_value=10_000, value=1, step=10)
+        expected_edges = self.p * self.N * (self.N - 1) / 2
+        st.sidebar.caption(f"Expected number of edges {expected_edges:,.0f}")
+        try:
+            check_parameters(self.N, self.p)
+        except ValueError as error:
+            st.error(str(error))
+            st.stop()
         
 
     def _initial_image(self):
-        self.plot_placeholder = st.empty()
-        
-        # Display initial network state
-        fig, ax = plt.subplots(figsize=(8, 8))
-        nx.draw(self.G, ax=ax, with_labels=True)
-        ax.set_title("Initial State", fontsize=10)
-        self.plot_placeholder.pyplot(fig)
+        # A single figure per panel is reused for all frames
+        col_network, col_degree = st.columns(2)
+        self.renderer = FigureRenderer(col_network.empty(), figsize=(8, 8)) if self.N <= self.max_drawn_nodes else None
+        self.layout = IncrementalLayout()
+        self.degree_renderer = FigureRenderer(col_degree.empty(), figsize=(8, 6))
+        self._append_fig(-1, self._snapshot(), "Initial State")
+    
+    
+    def _draw_network(self, ax, edges, title):
+        G = nx.empty_graph(self.N)
+        G.add_edges_from(edges.tolist())
+        # Nodes keep their positions between frames, and only move around edges that changed
+        pos = self.layout.layout(G.nodes, G.edges)
+        nx.draw(G, pos=pos, ax=ax, with_labels=True)
+        ax.set_title(title, fontsize=10)
+    
+    
+    def _draw_degree_distribution(self, ax, degree_histogram, number_of_components):
+        ax.bar(np.arange(degree_histogram.size), degree_histogram / self.N, width=1.)
+        ax.set(xlabel="Degree", ylabel="Fraction of nodes")
+        ax.set_title(f"Degree distribution, {number_of_components} connected components", fontsize=10)
+    
+    
+    def _network_steps(self):
+        for _ in range(self.steps_per_frame):
+            self._network_step()
+    
+    
+    def _snapshot(self):
+        # Taken on the simulation thread, so the frame does not change while it is drawn
+        edges = self.edge_list().copy() if self.N <= self.max_drawn_nodes else None
+        return edges, np.trim_zeros(self.degree_histogram, "b").copy(), self.components()
     
     
-    def _append_fig(self, step):
-        fig, ax = plt.subplots(figsize=(8, 8))
-        nx.draw(self.G, ax=ax, with_labels=True)
-        ax.set_title(f"Step {step + 1}", fontsize=10)
-        self.plot_placeholder.pyplot(fig)   
-        time.sleep(0.1)
+    def _append_fig(self, step, snapshot, title=None):
+        edges, degree_histogram, number_of_components = snapshot
+        if title is None:
+            title = f"Step {(step + 1) * self.steps_per_frame}, render {self.degree_renderer.last_render_ms():.0f} ms, layout {self.layout.last_layout_ms():.0f} ms"
+        if self.renderer is not None:
+            self.renderer.render(lambda ax: self._draw_network(ax, edges, title))
+        self.degree_renderer.render(lambda ax: self._draw_degree_distribution(ax, degree_histogram, number_of_components))
     
     
     def animate(self):
@@ -58,7 +77,11 @@ class ErdosRenyiNetworkModel():
         self._initialize_network()
         self._initial_image()
         
+        # The simulation runs in the background, and frames are skipped if it is faster than 10 frames per second.
+        # The degree distribution and components are only computed once per frame
         if st.button("Play"):
-            for i in range(self.time_steps):
-                self._network_step()
-                self._append_fig(i)
\ No newline at end of file
+            for i, snapshot in timed_frames(self._network_steps, self._snapshot, max(1, self.time_steps // self.steps_per_frame)):
+                self._append_fig(i, snapshot)
+        if self.renderer is not None:
+            self.renderer.close()
+        self.degree_renderer.close()
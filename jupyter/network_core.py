@@ -0,0 +1,142 @@
+import networkx as nx
+import numpy as np
+
+
+# More edges than this do not fit comfortably in memory, together with the map from edge to row
+MAX_EDGES = 2_000_000
+
+
+def check_parameters(N, p):
+    """Raise ValueError if the network would have more than MAX_EDGES edges on average."""
+    expected_edges = p * N * (N - 1) / 2
+    if expected_edges > MAX_EDGES:
+        raise ValueError(f"Lower N or p to have at most {MAX_EDGES:,} edges on average, not {expected_edges:,.0f}")
+
+
+def connected_component_labels(number_of_nodes, edges):
+    """Label every node with the smallest node index in its connected component, using array operations only.
+    Labels are propagated along the edges and shortcut by pointer jumping until nothing changes.
+    """
+    labels = np.arange(number_of_nodes)
+    u, v = edges[:, 0], edges[:, 1]
+    while True:
+        smallest = np.minimum(labels[u], labels[v])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, u, smallest)
+        np.minimum.at(new_labels, v, smallest)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+class ErdosRenyiNetworkSimulation:
+    def __init__(self, N=50, p=0.5, time_steps=100, seed=None):
+        """Illustration of a simple Erdos-Renyi network model where at each time step, one edge is deleted and another is added.
+        Simulation core without any plotting or Streamlit code. Parameters default to the sidebar defaults of ErdosRenyiNetworkModel.
+        """
+        self.N = N
+        self.p = p
+        self.time_steps = time_steps
+        self.seed = seed
+
+
+    def _initialize_network(self):
+        """Store the edges in an array, with a map from edge to its row, so a uniformly random edge is found
+        and removed in constant time. The map is keyed by the integer u * N + v with u <= v, which takes far less memory than tuples.
+        Self-loops are allowed and count twice towards the degree, as in networkx.
+        """
+        self.rng = np.random.default_rng(self.seed)
+        G = nx.fast_gnp_random_graph(self.N, self.p, seed=int(self.rng.integers(2**32)))
+        self.edges = np.array(G.edges, dtype=np.int64).reshape(-1, 2)
+        self.number_of_edges = len(self.edges)
+        self.edge_position = self._edge_positions()
+
+        self.degree = np.bincount(self.edges.ravel(), minlength=self.N)
+        self.degree_histogram = np.bincount(self.degree, minlength=self.N + 2)
+        self.components_stale = True
+
+
+    def _edge_positions(self):
+        edges = self.edge_list()
+        return dict(zip((edges[:, 0] * self.N + edges[:, 1]).tolist(), range(len(edges))))
+
+
+    def _change_degree(self, node, change):
+        self.degree_histogram[self.degree[node]] -= 1
+        self.degree[node] += change
+        self.degree_histogram[self.degree[node]] += 1
+
+
+    def _add_edge(self, u, v):
+        u, v = min(u, v), max(u, v)
+        key = u * self.N + v
+        if key in self.edge_position:
+            return
+        if self.number_of_edges == len(self.edges):
+            # Double the capacity, so adding edges takes amortized constant time
+            self.edges = np.concatenate([self.edges, np.zeros((max(16, len(self.edges)), 2), dtype=np.int64)])
+        self.edges[self.number_of_edges] = u, v
+        self.edge_position[key] = self.number_of_edges
+        self.number_of_edges += 1
+        self._change_degree(u, 1)
+        self._change_degree(v, 1)
+        self.components_stale = True
+
+
+    def _remove_edge(self, index):
+        """Remove the edge in the given row by moving the last edge into its place."""
+        u, v = self.edges[index].tolist()
+        last = self.number_of_edges - 1
+        self.edges[index] = self.edges[last]
+        moved_u, moved_v = self.edges[index].tolist()
+        self.edge_position[moved_u * self.N + moved_v] = index
+        del self.edge_position[u * self.N + v]
+        self.number_of_edges = last
+        self._change_degree(u, -1)
+        self._change_degree(v, -1)
+        self.components_stale = True
+
+
+    def _network_step(self):
+        """Delete a random edge and add a random edge"""
+        if self.number_of_edges > 0:
+            self._remove_edge(self.rng.integers(0, self.number_of_edges))
+
+        u, v = self.rng.integers(0, self.N, size=2).tolist()
+        self._add_edge(u, v)
+
+
+    def components(self):
+        """Number of connected components, recomputed only if the edges changed since the last call."""
+        if self.components_stale:
+            self.number_of_components = np.unique(connected_component_labels(self.N, self.edge_list())).size
+            self.components_stale = False
+        return self.number_of_components
+
+
+    def edge_list(self):
+        return self.edges[:self.number_of_edges]
+
+
+    def state(self):
+        return {
+            "edges": self.edge_list().tolist(), "number_of_edges": self.number_of_edges,
+            "degree_histogram": np.trim_zeros(self.degree_histogram, "b"), "number_of_components": self.components(),
+        }
+
+
+    def checkpoint(self):
+        """Copy of everything that changes during the simulation, enough to continue it exactly with restore()."""
+        return {"edges": self.edge_list().copy(), "rng": self.rng.bit_generator.state}
+
+
+    def restore(self, checkpoint):
+        """Continue from a checkpoint. The simulation must be initialized with the same parameters."""
+        self.rng.bit_generator.state = checkpoint["rng"]
+        self.number_of_edges = len(checkpoint["edges"])
+        self.edges = checkpoint["edges"].copy()
+        self.edge_position = self._edge_positions()
+        self.degree = np.bincount(self.edge_list().ravel(), minlength=self.N)
+        self.degree_histogram = np.bincount(self.degree, minlength=self.N + 2)
+        self.components_stale = True
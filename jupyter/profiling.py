@@ -0,0 +1,90 @@
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+
+import numpy as np
+
+
+class PhaseTimer:
+    def __init__(self, window=50):
+        """Wall clock time spent in named phases of a run, such as step, analysis and render.
+        Keeps the total and the last window durations of every phase. Phases may be timed from several threads,
+        e.g. the simulation thread of a SimulationRunner and the thread drawing the frames.
+        """
+        self.window = window
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.counts = {}
+        self.recent = {}
+
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0.) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.recent.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+
+    def wrap(self, name, function):
+        """function, timed as the given phase on every call."""
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return timed
+
+
+    def summary(self):
+        """{phase: {"calls", "total_ms", "mean_ms", "recent_ms", "share"}}, where recent_ms is the mean over the last window calls
+        and share the fraction of the time of all phases.
+        """
+        with self.lock:
+            total = sum(self.totals.values()) or 1.
+            return {
+                name: {
+                    "calls": self.counts[name], "total_ms": 1000 * self.totals[name], "mean_ms": 1000 * self.totals[name] / self.counts[name],
+                    "recent_ms": 1000 * sum(self.recent[name]) / len(self.recent[name]), "share": self.totals[name] / total,
+                }
+                for name in self.totals
+            }
+
+
+def approximate_bytes(value, samples=16, depth=4):
+    """Approximate memory held by a value and everything it references, e.g. the state of a simulation core.
+    Arrays count with their data, containers with their elements and objects with their attributes.
+    The elements of a container are extrapolated from up to samples of them, so this stays fast for millions of elements.
+    Objects referenced more than once are counted every time, so the estimate errs on the high side.
+    """
+    if isinstance(value, np.ndarray):
+        # getsizeof includes the data of arrays that own it, but not of views
+        return sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+    if depth == 0:
+        return sys.getsizeof(value)
+    if isinstance(value, (dict, list, tuple, set, frozenset, deque)):
+        size = sys.getsizeof(value)
+        if not value:
+            return size
+        if isinstance(value, dict):
+            picks = [approximate_bytes(key, samples, depth - 1) + approximate_bytes(item, samples, depth - 1)
+                     for key, item in islice(value.items(), samples)]
+        elif isinstance(value, (set, frozenset)):
+            picks = [approximate_bytes(element, samples, depth - 1) for element in islice(value, samples)]
+        else:
+            # Evenly spaced, as e.g. neighbour lists differ between the edge and the bulk of a grid
+            indices = np.linspace(0, len(value) - 1, min(samples, len(value))).astype(int)
+            picks = [approximate_bytes(value[index], samples, depth - 1) for index in indices]
+        return size + len(value) * sum(picks) / len(picks)
+    if hasattr(value, "__dict__") and not callable(value):
+        return sys.getsizeof(value) + sum(approximate_bytes(attribute, samples, depth - 1) for attribute in vars(value).values())
+    return sys.getsizeof(value)
@@ -0,0 +1,139 @@
+"""Registry of the available models.
+
+Every model has a simulation core without Streamlit or matplotlib, and a Streamlit UI class built on top of it.
+Both are given as "module:Class" strings and only imported the first time they are needed, as is an optional
+"check" function that rejects combinations of parameters which are valid on their own,
+so e.g. the Flask backend never imports Streamlit.
+"""
+import importlib
+
+
+MODELS = {
+    "Ising": {
+        "core": "ising_core:IsingSimulation",
+        "ui": "ising_model:IsingModel",
+        "initialize": "_initialize_grid",
+        "step": "_ising_step",
+        "frame": "grid",  # State entry that is streamed as an image
+        "parameters": {
+            # The checkerboard sublattices only separate neighbours across the periodic boundary for even N
+            "N": {"type": "int", "min": 10, "max": 100, "default": 50, "multiple_of": 2},
+            "temperature": {"type": "float", "min": 0.1, "max": 5.0, "default": 2.0},
+            "update_method": {"type": "choice", "options": ["Checkerboard", "Sequential", "Wolff cluster"], "default": "Checkerboard"},
+        },
+    },
+    "Erdos-Renyi Network": {
+        "core": "network_core:ErdosRenyiNetworkSimulation",
+        "ui": "network:ErdosRenyiNetworkModel",
+        "initialize": "_initialize_network",
+        "step": "_network_step",
+        "check": "network_core:check_parameters",  # Raises ValueError for parameter combinations that are too large
+        "parameters": {
+            "N": {"type": "int", "min": 5, "max": 100_000, "default": 50},
+            "p": {"type": "float", "min": 0.0, "max": 1.0, "default": 0.5},
+        },
+    },
+    "Sandpile": {
+        "core": "sandpile_core:SandpileSimulation",
+        "ui": "sandpile_model:SandpileModel",
+        "initialize": "_initial_grid",
+        "step": "_step",
+        "frame": "grid",
+        "parameters": {
+            "N": {"type": "int", "min": 10, "max": 100, "default": 50},
+            "add_location": {"type": "choice", "options": ["Center", "Random"], "default": "Center"},
+            "topple_method": {"type": "choice", "options": ["Worklist", "Parallel wave"], "default": "Worklist"},
+        },
+    },
+    "Lichen": {
+        "core": "lichen_core:LichenSimulation",
+        "ui": "lichen_model:LichenModel",
+        "initialize": "_initialize_grid",
+        "step": "_lichen_step",
+        "batch_step": "_lichen_steps",  # Performs a given number of steps in one call
+        "frame": "lichen",
+        "parameters": {
+            "L": {"type": "int", "min": 10, "max": 200, "default": 50},
+            "alpha": {"type": "float", "min": 0.0, "max": 1.0, "default": 0.1},
+            "gamma": {"type": "float", "min": 0.0, "max": 1.0, "default": 0.1},
+            "storage": {"type": "choice", "options": ["Dense", "Tiles"], "default": "Dense"},
+            "update_method": {"type": "choice", "options": ["Random site", "Kinetic Monte Carlo"], "default": "Random site"},
+        },
+    },
+}
+
+_loaded = {}
+
+
+def _load(path):
+    if path not in _loaded:
+        module_name, class_name = path.split(":")
+        _loaded[path] = getattr(importlib.import_module(module_name), class_name)
+    return _loaded[path]
+
+
+def load_core(model):
+    return _load(MODELS[model]["core"])
+
+
+def load_ui(model):
+    return _load(MODELS[model]["ui"])
+
+
+def parameter_schema(model):
+    return MODELS[model]["parameters"]
+
+
+def validate_parameters(model, parameters):
+    """Fill in defaults and check the given parameters against the schema. Raises ValueError for invalid parameters."""
+    schema = parameter_schema(model)
+    unknown = set(parameters) - set(schema)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {model}: {sorted(unknown)}")
+
+    validated = {}
+    for name, spec in schema.items():
+        value = parameters.get(name, spec["default"])
+        if spec["type"] == "choice":
+            if value not in spec["options"]:
+                raise ValueError(f"{name} must be one of {spec['options']}")
+        else:
+            value = int(value) if spec["type"] == "int" else float(value)
+            if not spec["min"] <= value <= spec["max"]:
+                raise ValueError(f"{name} must be between {spec['min']} and {spec['max']}")
+            if "multiple_of" in spec and value % spec["multiple_of"]:
+                raise ValueError(f"{name} must be a multiple of {spec['multiple_of']}")
+        validated[name] = value
+    if "check" in MODELS[model]:
+        _load(MODELS[model]["check"])(**validated)
+    return validated
+
+
+def create_simulation(model, parameters=None, seed=None):
+    """Create and initialize the simulation core of a model."""
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model}, choose from {list(MODELS)}")
+    simulation = load_core(model)(**validate_parameters(model, parameters or {}), seed=seed)
+    getattr(simulation, MODELS[model]["initialize"])()
+    return simulation
+
+
+def advance(model, simulation, number_of_steps):
+    """Perform number_of_steps steps, using the batched step function if the model has one."""
+    spec = MODELS[model]
+    if "batch_step" in spec:
+        getattr(simulation, spec["batch_step"])(number_of_steps)
+    else:
+        step = getattr(simulation, spec["step"])
+        for _ in range(number_of_steps):
+            step()
+
+
+def checkpoint(simulation):
+    """Everything needed to continue a simulation core later, grids, counters and random generator states included."""
+    return simulation.checkpoint()
+
+
+def restore(simulation, checkpoint):
+    """Continue from a checkpoint, in a simulation created with the same model and parameters."""
+    simulation.restore(checkpoint)
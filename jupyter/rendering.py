@@ -0,0 +1,157 @@
+import time
+import numpy as np
+import streamlit as st
+import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from history import GridHistory, history_directory, evict_histories
+from profiling import PhaseTimer
+from runner import SimulationRunner
+
+
+def session_history(model, parameters, shape, dtype):
+    """GridHistory of a model in the current Streamlit session, which is found again after a rerun.
+    Histories of other sessions are deleted, least recently written first, once all histories exceed their disk budget.
+    """
+    context = get_script_run_ctx()
+    directory = history_directory(model, parameters, context.session_id if context is not None else "default")
+    evict_histories(keep=directory)
+    return GridHistory(directory, shape, dtype)
+
+
+def history_controls(history, show):
+    """Sidebar slider to scrub through the frames of a GridHistory, and Play, Resume and Replay buttons.
+    show(step, grid) draws a recorded frame. Returns the label of the pressed button, or None.
+    """
+    st.sidebar.header("History")
+    stride = f", one in every {history.stride} frames" if history.stride > 1 else ""
+    st.sidebar.caption(f"{len(history)} frames recorded on disk{stride}")
+    if len(history) > 1:
+        frame = st.sidebar.slider("Recorded frame", min_value=0, max_value=len(history) - 1, value=len(history) - 1)
+        show(*history.frame(frame))
+    
+    pressed = None
+    for column, label in zip(st.columns(3), ("Play", "Resume", "Replay")):
+        if column.button(label, key=f"{label.lower()}_button", use_container_width=True):
+            pressed = label
+    return pressed
+
+
+def phase_timings(placeholder, timer):
+    """Table of the time spent per phase of a PhaseTimer, e.g. in a sidebar placeholder that is updated every frame."""
+    rows = [
+        f"| {name} | {phase['recent_ms']:.1f} | {phase['calls']} | {100 * phase['share']:.0f}% |"
+        for name, phase in timer.summary().items()
+    ]
+    placeholder.markdown("\n".join(["| Phase | ms per call | Calls | Share |", "|---|---|---|---|", *rows]))
+
+
+def timed_frames(step, snapshot, number_of_frames, fps=10):
+    """Run a SimulationRunner and yield its (frame, snapshot) pairs, at most fps per second.
+    The code handling a frame is timed as the render phase, and the time per phase is shown in the sidebar while running.
+    """
+    timer = PhaseTimer()
+    timings = st.sidebar.expander("Time per phase").empty()
+    runner = SimulationRunner(step, snapshot, number_of_frames, timer=timer)
+    for frame, frame_snapshot in runner.frames(fps=fps):
+        with timer.phase("render"):
+            yield frame, frame_snapshot
+        phase_timings(timings, timer)
+
+
+def play_history(action, history, simulation, grid, advance, snapshot, draw, show, number_of_frames, steps_per_frame=1, fps=10):
+    """Carry out the button pressed in history_controls, and return True if the simulation was run.
+    Replay shows the recorded frames with show(step, grid). Play and Resume run number_of_frames frames in the background,
+    where advance() performs the steps_per_frame steps of a frame and grid() is then appended to the history.
+    draw(step, snapshot) draws the newest frame, with the zero-based index of its last step.
+    """
+    if action == "Replay":
+        for step, recorded in history.replay():
+            show(step, recorded)
+            time.sleep(1 / fps)
+        return False
+    if action is None:
+        return False
+
+    first_step = history.start(simulation, grid(), resume=action == "Resume")
+    last_step = first_step + number_of_frames * steps_per_frame
+    step_count = first_step
+
+    def recorded_step():
+        # Runs on the simulation thread
+        nonlocal step_count
+        advance()
+        step_count += steps_per_frame
+        history.append(grid(), step_count, simulation.checkpoint, final=step_count == last_step)
+
+    for frame, frame_snapshot in timed_frames(recorded_step, snapshot, number_of_frames, fps):
+        draw(first_step + (frame + 1) * steps_per_frame - 1, frame_snapshot)
+    return True
+
+
+def colour_table(colors):
+    """RGB lookup table with one uint8 row per matplotlib colour."""
+    return np.round(np.array([mcolors.to_rgb(color) for color in colors]) * 255).astype(np.uint8)
+
+
+class FrameRenderer:
+    def __init__(self, placeholder, colors, offset=0, display_size=600):
+        """Draw integer grids as RGB images in a Streamlit placeholder, without going through matplotlib.
+        Grid value v gets colors[v - offset], and values outside the table get the first or last colour.
+        The image is upscaled to roughly display_size pixels by repeating pixels, so cells stay sharp.
+        """
+        self.placeholder = placeholder
+        self.offset = offset
+        self.display_size = display_size
+        self.render_times = []
+        self.set_colors(colors)
+
+
+    def set_colors(self, colors):
+        self.table = colour_table(colors)
+
+
+    def to_rgb(self, grid):
+        index = np.clip(grid - self.offset, 0, len(self.table) - 1)
+        scale = max(1, self.display_size // max(grid.shape))
+        rgb = self.table[index]
+        return rgb.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+    def render(self, grid, caption=None):
+        start = time.perf_counter()
+        self.placeholder.image(self.to_rgb(grid), caption=caption)
+        self.render_times.append(time.perf_counter() - start)
+
+
+    def last_render_ms(self):
+        return 1000 * self.render_times[-1] if self.render_times else 0.
+
+
+class FigureRenderer:
+    def __init__(self, placeholder, figsize=(6, 6), nrows=1):
+        """For plots that need matplotlib axes. A single figure is kept and its axes cleared for every frame,
+        so no new figures are created while animating. With nrows > 1 the figure has a column of axes.
+        """
+        self.placeholder = placeholder
+        self.fig, self.ax = plt.subplots(nrows=nrows, figsize=figsize)
+        self.render_times = []
+
+
+    def render(self, draw):
+        """draw(ax) adds the content of the frame to the cleared axes, or to the array of axes if there are several."""
+        start = time.perf_counter()
+        for ax in np.atleast_1d(self.ax):
+            ax.clear()
+        draw(self.ax)
+        self.placeholder.pyplot(self.fig)
+        self.render_times.append(time.perf_counter() - start)
+
+
+    def last_render_ms(self):
+        return 1000 * self.render_times[-1] if self.render_times else 0.
+
+
+    def close(self):
+        plt.close(self.fig)
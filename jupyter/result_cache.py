@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import registry
+
+
+DEFAULT_DIRECTORY = Path(os.environ.get("WIM_CACHE_DIR", Path.home() / ".cache" / "web-illustrated-models"))
+
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=500_000_000):
+        """Content-addressed disk cache of deterministic results, e.g. animation frames or simulation checkpoints.
+        Entries are keyed by (model, parameters, seed, step) and stored as one pickle file per entry.
+        When the cache grows beyond max_bytes, the least recently used entries are deleted.
+        Only use it for deterministic results, e.g. seeded runs, as anything random without a seed is not reproducible.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.unchecked_bytes = max_bytes  # Bytes written since the cache size was last checked
+
+
+    @staticmethod
+    def key(model, parameters, seed, step):
+        description = json.dumps([model, parameters, seed, step], sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+
+    def _path(self, key):
+        return self.directory / f"{key}.pkl"
+
+
+    def get(self, model, parameters, seed, step):
+        """The cached value, or None if there is none."""
+        path = self._path(self.key(model, parameters, seed, step))
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        # The modification time records the last use, for the eviction order
+        path.touch()
+        self.hits += 1
+        return value
+
+
+    def put(self, model, parameters, seed, step, value):
+        path = self._path(self.key(model, parameters, seed, step))
+        # Write to a temporary file first, so other processes never read a partly written entry
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.unchecked_bytes += file.tell()
+        os.replace(file.name, path)
+        # Listing the directory is slow with many entries, so only check the size after writing a few percent of max_bytes
+        if self.unchecked_bytes > self.max_bytes // 20:
+            self._evict()
+            self.unchecked_bytes = 0
+
+
+    def _evict(self):
+        entries = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+    def size(self):
+        return sum(path.stat().st_size for path in self.directory.glob("*.pkl"))
+
+
+    def clear(self):
+        for path in self.directory.glob("*.pkl"):
+            path.unlink(missing_ok=True)
+
+
+def advance_cached(cache, model, parameters, seed, simulation, step, number_of_steps, checkpoint_interval=100):
+    """Advance a seeded simulation from step to step + number_of_steps, reusing checkpoints from the cache.
+    Checkpoints are looked up and stored at every multiple of checkpoint_interval only, so a run that has been computed before,
+    by anyone, is restored instead of recomputed, and a client stepping one step at a time does not add an entry per step.
+    """
+    target = step + number_of_steps
+    parameters = registry.validate_parameters(model, parameters)
+    for candidate in range(target - target % checkpoint_interval, step, -checkpoint_interval):
+        checkpoint = cache.get(model, parameters, seed, candidate)
+        if checkpoint is not None:
+            registry.restore(simulation, checkpoint)
+            step = candidate
+            break
+
+    while step < target:
+        next_step = min(target, step + checkpoint_interval - step % checkpoint_interval)
+        registry.advance(model, simulation, next_step - step)
+        step = next_step
+        if step % checkpoint_interval == 0:
+            cache.put(model, parameters, seed, step, registry.checkpoint(simulation))
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+
+
+class SimulationRunner:
+    def __init__(self, step, snapshot, number_of_frames, queue_size=4, timer=None):
+        """Run a simulation in a background thread and hand frames to the UI thread through a bounded queue.
+        step() advances the simulation to the next frame and snapshot() returns a copy of what should be drawn.
+        When the queue is full the oldest frame is dropped, so the simulation never waits on the renderer.
+        The worker must not call Streamlit, only the thread consuming frames() may draw.
+        With a PhaseTimer, step() is timed as the step phase and snapshot() as the analysis phase.
+        """
+        if timer is not None:
+            step = timer.wrap("step", step)
+            snapshot = timer.wrap("analysis", snapshot)
+        self.step = step
+        self.snapshot = snapshot
+        self.number_of_frames = number_of_frames
+        self.queue = deque(maxlen=queue_size)
+        self.available = threading.Condition()
+        self.stop_event = threading.Event()
+        self.done = False
+        self.error = None
+        self.dropped_frames = 0
+        self.thread = threading.Thread(target=self._produce, daemon=True)
+
+
+    def _produce(self):
+        try:
+            for frame in range(self.number_of_frames):
+                if self.stop_event.is_set():
+                    break
+                self.step()
+                snapshot = self.snapshot()
+                with self.available:
+                    if len(self.queue) == self.queue.maxlen:
+                        self.dropped_frames += 1
+                    self.queue.append((frame, snapshot))
+                    self.available.notify()
+        except Exception as error:
+            self.error = error
+        finally:
+            with self.available:
+                self.done = True
+                self.available.notify()
+
+
+    def frames(self, fps=20):
+        """Yield (frame, snapshot) pairs at most fps times per second, always the newest available frame.
+        Older frames still in the queue are skipped. The last frame of the run is always yielded.
+        """
+        self.thread.start()
+        try:
+            while True:
+                tick = time.perf_counter()
+                with self.available:
+                    while not self.queue and not self.done:
+                        self.available.wait()
+                    if not self.queue:
+                        break
+                    self.dropped_frames += len(self.queue) - 1
+                    frame = self.queue.pop()
+                    self.queue.clear()
+                yield frame
+                time.sleep(max(0., 1 / fps - (time.perf_counter() - tick)))
+        finally:
+            # Also reached when Streamlit stops the script, e.g. on a rerun
+            self.stop()
+        if self.error is not None:
+            raise self.error
+
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,132 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from sandpile_core import SandpileSimulation
+
+
+class AvalancheLog:
+    def __init__(self, capacity=1024):
+        """Array backed log of avalanche size, area and duration, one entry per added grain.
+        The arrays double in size when full, so appending is cheap on average.
+        """
+        self.length = 0
+        self._data = np.zeros((3, capacity), dtype=np.int32)
+
+
+    def _reserve(self, length):
+        if length > self._data.shape[1]:
+            data = np.zeros((3, max(length, 2 * self._data.shape[1])), dtype=self._data.dtype)
+            data[:, :self.length] = self._data[:, :self.length]
+            self._data = data
+
+
+    def append(self, size, area, duration):
+        self._reserve(self.length + 1)
+        self._data[:, self.length] = size, area, duration
+        self.length += 1
+
+
+    def extend(self, other):
+        self._reserve(self.length + other.length)
+        self._data[:, self.length:self.length + other.length] = other._data[:, :other.length]
+        self.length += other.length
+
+
+    @property
+    def sizes(self):
+        return self._data[0, :self.length]
+
+
+    @property
+    def areas(self):
+        return self._data[1, :self.length]
+
+
+    @property
+    def durations(self):
+        return self._data[2, :self.length]
+
+
+    def histograms(self, bins_per_decade=10):
+        """Log-binned probability densities of avalanche size, area and duration."""
+        return {
+            "size": log_binned_histogram(self.sizes, bins_per_decade),
+            "area": log_binned_histogram(self.areas, bins_per_decade),
+            "duration": log_binned_histogram(self.durations, bins_per_decade),
+        }
+
+
+    def save(self, path, bins_per_decade=10):
+        """Store the raw log and its histograms in a single .npz file."""
+        arrays = {"size": self.sizes, "area": self.areas, "duration": self.durations}
+        for name, (centers, density) in self.histograms(bins_per_decade).items():
+            arrays[f"{name}_bin_centers"] = centers
+            arrays[f"{name}_density"] = density
+        np.savez_compressed(path, **arrays)
+
+
+def log_binned_histogram(values, bins_per_decade=10):
+    """Histogram of the positive values with logarithmically spaced bins, normalized to a probability density.
+    Returns the geometric bin centers and the densities. Bins are integer aligned, as all observables are counts.
+    """
+    values = values[values > 0]
+    if values.size == 0:
+        return np.array([]), np.array([])
+
+    number_of_bins = int(np.ceil(np.log10(values.max() + 1) * bins_per_decade)) + 1
+    edges = np.unique(np.floor(np.logspace(0, np.log10(values.max() + 1), number_of_bins)))
+    counts, edges = np.histogram(values, bins=edges)
+    widths = np.diff(edges)
+    centers = np.sqrt(edges[:-1] * edges[1:])
+    return centers, counts / (widths * values.size)
+
+
+def run_batch(N=50, grains=100_000, add_location="Random", topple_method="Worklist", warmup=0, seed=None):
+    """Add grains to the sandpile without any plotting, logging every avalanche.
+    The first warmup grains are not logged, to let the random initial grid reach the critical state.
+    """
+    sandpile = SandpileSimulation(N=N, add_location=add_location, topple_method=topple_method, seed=seed)
+    sandpile._initial_grid()
+
+    log = AvalancheLog(capacity=grains)
+    for grain in range(warmup + grains):
+        sandpile._step()
+        if grain >= warmup:
+            log.append(sandpile.avalanche_size, sandpile.avalanche_area, sandpile.avalanche_duration)
+    return log
+
+
+def run_ensemble(seeds, processes=None, **kwargs):
+    """Run one batch per seed in a process pool and combine the logs. kwargs are passed on to run_batch."""
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        logs = list(pool.map(partial(_run_seed, **kwargs), seeds))
+
+    combined = AvalancheLog(capacity=sum(log.length for log in logs))
+    for log in logs:
+        combined.extend(log)
+    return combined
+
+
+def _run_seed(seed, **kwargs):
+    return run_batch(seed=seed, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect sandpile avalanche statistics without the Streamlit app.")
+    parser.add_argument("--N", type=int, default=50, help="Grid size")
+    parser.add_argument("--grains", type=int, default=100_000, help="Number of logged grains per seed")
+    parser.add_argument("--warmup", type=int, default=10_000, help="Number of grains added before logging")
+    parser.add_argument("--location", choices=("Center", "Random"), default="Random", help="Grain addition location")
+    parser.add_argument("--method", choices=("Worklist", "Parallel wave"), default="Worklist", help="Toppling method")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="One independent run per seed")
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--output", default="avalanches.npz", help="Output .npz file")
+    args = parser.parse_args()
+
+    log = run_ensemble(args.seeds, processes=args.processes, N=args.N, grains=args.grains, warmup=args.warmup,
+                       add_location=args.location, topple_method=args.method)
+    log.save(args.output)
+    print(f"Logged {log.length} avalanches, mean size {log.sizes.mean():.2f}, saved to {args.output}")
@@ -0,0 +1,201 @@
+import numpy as np
+
+
+def stabilize(grid, critical_height=4, check_interval=4):
+    """Topple the grid until every site is below the critical height. Grains toppled over the edge are lost.
+    Returns the stable grid, the number of topplings of every site and the number of sweeps. By the abelian property the
+    result does not depend on the order of the topplings, so it equals adding the grains one by one and toppling after each grain.
+    Every sweep topples each site grid // critical_height times at once, which is legal since the site holds enough grains
+    for all of them. critical_height must be a power of two, so the division is a bit shift. Only a window around the unstable sites is updated. The window grows by one site per sweep
+    and is shrunk to the bounding box of the unstable sites every check_interval sweeps.
+    """
+    N, M = grid.shape
+    # Heights never exceed the total number of grains, so int32 is enough for most grids and halves the memory traffic
+    dtype = np.int32 if grid.sum() < np.iinfo(np.int32).max else np.int64
+    # One ring of sink sites around the grid absorbs the grains toppled over the edge
+    heights = np.zeros((N + 2, M + 2), dtype=dtype)
+    heights[1:-1, 1:-1] = grid
+    topplings = np.zeros((N + 2, M + 2), dtype=np.int64)
+    shift = critical_height.bit_length() - 1
+
+    top, bottom, left, right = 1, N + 1, 1, M + 1
+    sweeps = 0
+    while True:
+        unstable = heights[top:bottom, left:right] >= critical_height
+        rows = np.flatnonzero(unstable.any(axis=1))
+        if rows.size == 0:
+            break
+        columns = np.flatnonzero(unstable.any(axis=0))
+        top, bottom, left, right = top + rows[0], top + rows[-1] + 1, left + columns[0], left + columns[-1] + 1
+
+        for _ in range(check_interval):
+            sweeps += 1
+            window = heights[top:bottom, left:right]
+            topples = window >> shift
+            topplings[top:bottom, left:right] += topples
+            window -= topples << shift
+            heights[top - 1:bottom - 1, left:right] += topples
+            heights[top + 1:bottom + 1, left:right] += topples
+            heights[top:bottom, left - 1:right - 1] += topples
+            heights[top:bottom, left + 1:right + 1] += topples
+            top, bottom, left, right = max(top - 1, 1), min(bottom + 1, N + 1), max(left - 1, 1), min(right + 1, M + 1)
+    # The sweeps are counted in blocks of check_interval, so the last few may not have toppled anything
+    return heights[1:-1, 1:-1].astype(grid.dtype), topplings[1:-1, 1:-1], sweeps
+
+
+def identity(N, critical_height=4):
+    """Identity element of the sandpile group of an NxN grid, stab(2c - stab(2c)) with c the all (critical_height - 1) grid.
+    Adding it to any recurrent configuration and stabilizing gives back that configuration.
+    """
+    doubled = np.full((N, N), 2 * (critical_height - 1), dtype=np.int64)
+    return stabilize(doubled - stabilize(doubled, critical_height)[0], critical_height)[0]
+
+
+class SandpileSimulation:
+    def __init__(self, N=50, time_steps=100, add_location="Center", topple_method="Worklist", seed=None):
+        """Simulation core of the sandpile model, without any plotting or Streamlit code.
+        Parameters default to the sidebar defaults of SandpileModel.
+        """
+        self.critical_height = 4
+        self.N = N
+        self.time_steps = time_steps
+        self.add_location = add_location
+        self.topple_method = topple_method
+        self.seed = seed
+    
+    
+    def _initial_grid(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.grid = self.rng.integers(low=0, high=self.critical_height+1, size=(self.N, self.N), dtype=int)
+        self.avalanche_grid = np.zeros((self.N, self.N), dtype=int)  # Initialize avalanche grid
+        self.avalanche_size = self.avalanche_area = self.avalanche_duration = 0
+        self.is_stable = False  # The initial grid may contain unstable sites
+        self.neighbours = None  # Built by the first worklist toppling, as only that needs them
+    
+    
+    def _neighbour_lists(self):
+        """For each site (flat index), the flat indices of its neighbours. Grains toppled over the edge are lost."""
+        self.neighbours = []
+        for x in range(self.N):
+            for y in range(self.N):
+                self.neighbours.append([
+                    (x + dx) * self.N + y + dy for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                    if 0 <= x + dx < self.N and 0 <= y + dy < self.N
+                ])
+    
+
+    def _add_grain(self, x, y):
+        self.grid[x, y] += 1
+        # Once the grid is stable, only the site the grain was added to can become unstable
+        self._topple(start=[x * self.N + y] if self.is_stable else None)
+
+
+    def _topple(self, start=None):
+        """Relax the grid until all sites are below the critical height. 
+        By the abelian property, both methods give the same final grid and number of topplings per site.
+        start (flat indices) are the only sites that may be unstable. If not given, the whole grid is checked.
+        """
+        self.avalanche_size = 0
+        self.avalanche_area = 0  # Number of distinct sites that toppled
+        self.avalanche_duration = 0  # Number of toppling waves
+        self.avalanche_grid[:] = 0  # Reset avalanche grid
+        if self.topple_method == "Parallel wave":
+            self._topple_parallel()
+        else:
+            self._topple_worklist(start)
+        self.is_stable = True
+    
+    
+    def _topple_worklist(self, start=None):
+        """Topple the unstable sites one wave at a time, where the next wave only considers the sites that just toppled 
+        and their neighbours. The cost is proportional to the avalanche size instead of the grid size.
+        """
+        if self.neighbours is None:
+            self._neighbour_lists()
+        grid = self.grid.ravel()  # Flat views, so updates are written to the grids
+        avalanche_grid = self.avalanche_grid.ravel()
+        if start is None:
+            start = np.flatnonzero(grid >= self.critical_height).tolist()
+        unstable = [i for i in start if grid[i] >= self.critical_height]
+        toppled = set()
+        
+        while unstable:
+            self.avalanche_size += len(unstable)
+            self.avalanche_duration += 1
+            toppled.update(unstable)
+            candidates = set(unstable)
+            for i in unstable:
+                grid[i] -= 4
+                avalanche_grid[i] += 1  # Track toppling events
+                for j in self.neighbours[i]:
+                    grid[j] += 1
+                candidates.update(self.neighbours[i])
+            unstable = [i for i in candidates if grid[i] >= self.critical_height]
+        self.avalanche_area = len(toppled)
+    
+    
+    def _topple_parallel(self):
+        """Topple every unstable site at once, distributing the grains with shifted array slices."""
+        while True:
+            topples = (self.grid >= self.critical_height).astype(self.grid.dtype)
+            number_of_topples = np.count_nonzero(topples)
+            if number_of_topples == 0:
+                break
+            self.avalanche_size += number_of_topples
+            self.avalanche_duration += 1
+            self.avalanche_grid += topples  # Track toppling events
+            self.grid -= 4 * topples
+            self.grid[1:, :] += topples[:-1, :]
+            self.grid[:-1, :] += topples[1:, :]
+            self.grid[:, 1:] += topples[:, :-1]
+            self.grid[:, :-1] += topples[:, 1:]
+        self.avalanche_area = np.count_nonzero(self.avalanche_grid)
+
+    
+    def _add_grains(self, number_of_grains):
+        """Add number_of_grains grains at once and topple only at the end, with stabilize().
+        Gives the same grid as number_of_grains calls of _step, also for random locations, which are drawn in the same order.
+        The avalanche statistics then describe all topplings together, with the number of sweeps as the duration.
+        """
+        if self.add_location == "Center":
+            self.grid[self.N // 2, self.N // 2] += number_of_grains
+        elif self.add_location == "Random":
+            x, y = self.rng.integers(0, self.N, size=(number_of_grains, 2)).T
+            np.add.at(self.grid, (x, y), 1)
+        self.grid, self.avalanche_grid, self.avalanche_duration = stabilize(self.grid, self.critical_height)
+        self.avalanche_size = int(self.avalanche_grid.sum())
+        self.avalanche_area = np.count_nonzero(self.avalanche_grid)
+        self.is_stable = True
+
+
+    def _step(self):
+        if self.add_location == "Center":
+            self._add_grain(self.N // 2, self.N // 2)
+        elif self.add_location == "Random":
+            x, y = self.rng.integers(0, self.N, size=2)
+            self._add_grain(x, y)
+
+
+    def state(self):
+        return {
+            "grid": self.grid, "avalanche_grid": self.avalanche_grid, "avalanche_size": self.avalanche_size, 
+            "avalanche_area": self.avalanche_area, "avalanche_duration": self.avalanche_duration,
+        }
+    
+    
+    def checkpoint(self):
+        """Copy of everything that changes during the simulation, enough to continue it exactly with restore()."""
+        checkpoint = {key: value.copy() if isinstance(value, np.ndarray) else value for key, value in self.state().items()}
+        checkpoint.update(is_stable=self.is_stable, rng=self.rng.bit_generator.state)
+        return checkpoint
+    
+    
+    def restore(self, checkpoint):
+        """Continue from a checkpoint. The simulation must be initialized with the same parameters."""
+        self.grid = checkpoint["grid"].copy()
+        self.avalanche_grid = checkpoint["avalanche_grid"].copy()
+        self.avalanche_size = checkpoint["avalanche_size"]
+        self.avalanche_area = checkpoint["avalanche_area"]
+        self.avalanche_duration = checkpoint["avalanche_duration"]
+        self.is_stable = checkpoint["is_stable"]
+        self.rng.bit_generator.state = checkpoint["rng"]
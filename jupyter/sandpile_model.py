@@ -1,13 +1,19 @@
+import time
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
-import time
+from rendering import FrameRenderer, history_controls, play_history, session_history
+from result_cache import ResultCache
+from sandpile_core import SandpileSimulation, identity
+
+class SandpileModel(SandpileSimulation):
+    # Toppling time grows with the number of grains and, for the identity, about as N^3.6. With these limits a bulk
+    # addition takes at most a few seconds, while 10^6 grains at the center of a 1001 grid took 10 minutes.
+    # Drawing grids larger than max_bulk_size takes longer than toppling, and they have more cells than the image has pixels
+    max_bulk_grains = 100_000
+    max_bulk_size = 1001
+    max_identity_size = 151
+
 
-class SandpileModel:
-    def __init__(self):
-        self.critical_height = 4
-    
-    
     def _streamlit_setup(self):
         # Streamlit setup
         st.title("Sandpile Model Simulation")
@@ -18,87 +24,92 @@ class SandpileModel:
         self.critical_height = 4
         self.time_steps = st.sidebar.number_input("Number of Time Steps", min_value=1, max_value=1000, value=100, step=10)
         self.add_location = st.sidebar.selectbox("Grain Addition Location", ("Center", "Random"))
+        self.topple_method = st.sidebar.selectbox("Toppling Method", ("Worklist", "Parallel wave"))
     
         
-    def _initial_grid(self):
-        self.grid = np.random.randint(low=0, high=self.critical_height+1, size=(self.N, self.N), dtype=int)
-        self.avalanche_grid = np.zeros((self.N, self.N), dtype=int)  # Initialize avalanche grid
-    
+    def _bulk_setup(self):
+        """Sidebar controls for adding many grains to an empty grid at once. Returns whether the button was pressed."""
+        st.sidebar.header("Bulk addition")
+        self.bulk_mode = st.sidebar.selectbox("Configuration", ("Center", "Random", "Identity"))
+        max_size = self.max_identity_size if self.bulk_mode == "Identity" else self.max_bulk_size
+        self.bulk_N = st.sidebar.number_input("Bulk grid size", min_value=11, max_value=max_size, value=min(201, max_size), step=10)
+        self.bulk_grains = st.sidebar.number_input("Grains", min_value=1, max_value=self.max_bulk_grains, value=10_000, step=10_000,
+                                                   disabled=self.bulk_mode == "Identity")
+        self.bulk_seed = st.sidebar.number_input("Seed", min_value=0, value=0, disabled=self.bulk_mode != "Random")
+        return st.sidebar.button("Add grains at once")
 
-    def _add_grain(self, x, y):
-        self.grid[x, y] += 1
-        self._topple()
-
-
-    def _topple(self):
-        self.avalanche_size = 0
-        self.avalanche_grid[:] = 0  # Reset avalanche grid
-        while np.any(self.grid >= self.critical_height):
-            unstable_sites = np.argwhere(self.grid >= self.critical_height)
-            for x, y in unstable_sites:
-                self.avalanche_size += 1
-                self.avalanche_grid[x, y] += 1  # Track toppling events
-                self.grid[x, y] -= 4
-                if x > 0:
-                    self.grid[x - 1, y] += 1
-                if x < self.N - 1:
-                    self.grid[x + 1, y] += 1
-                if y > 0:
-                    self.grid[x, y - 1] += 1
-                if y < self.N - 1:
-                    self.grid[x, y + 1] += 1
 
-    
-    def _step(self):
-        if self.add_location == "Center":
-            self._add_grain(self.N // 2, self.N // 2)
-        elif self.add_location == "Random":
-            x, y = np.random.randint(0, self.N, size=2)
-            self._add_grain(x, y)
+    def _bulk_result(self):
+        """Stable grid and topplings per site of the bulk addition, or the identity of the sandpile group with no topplings.
+        The results are deterministic, so they are cached on disk.
+        """
+        parameters = {"mode": self.bulk_mode, "N": self.bulk_N}
+        if self.bulk_mode != "Identity":
+            parameters["grains"] = self.bulk_grains
+        seed = self.bulk_seed if self.bulk_mode == "Random" else None
+        cache = ResultCache()
+        result = cache.get("Sandpile bulk", parameters, seed, 0)
+        if result is None:
+            if self.bulk_mode == "Identity":
+                result = identity(self.bulk_N), np.zeros((self.bulk_N, self.bulk_N), dtype=np.int64)
+            else:
+                simulation = SandpileSimulation(N=self.bulk_N, add_location=self.bulk_mode, seed=seed)
+                simulation._initial_grid()
+                simulation.grid[:] = 0
+                simulation._add_grains(self.bulk_grains)
+                result = simulation.grid, simulation.avalanche_grid
+            cache.put("Sandpile bulk", parameters, seed, 0, result)
+        return result
+
+
+    def _show_bulk(self):
+        with st.spinner("Toppling"):
+            start = time.perf_counter()
+            grid, topplings = self._bulk_result()
+            seconds = time.perf_counter() - start
+        # Topplings span many orders of magnitude, so they are coloured by their number of digits
+        digits = np.where(topplings > 0, np.floor(np.log10(np.maximum(topplings, 1))).astype(int) + 1, 0)
+        state = "Identity of the sandpile group" if self.bulk_mode == "Identity" else f"Stable state after {self.bulk_grains} grains"
+        self.grid_renderer.render(grid, caption=f"{state}, {seconds:.2f} s. Height: black 0, red 1, orange 2, yellow 3")
+        self.avalanche_renderer.render(digits, caption=(
+            f"{topplings.sum()} topplings. Per site: black 0, purple 1-9, blue 10-99, red 100-999, orange 1000-9999, yellow 10000+"
+        ))
+
+
+    def _snapshot(self):
+        # Taken on the simulation thread, so the frame does not change while it is drawn
+        return self.grid.copy(), self.avalanche_grid.copy(), self.avalanche_size
+
+
+    def _initial_image(self):
+        # Heights above the critical height and more than 5 topplings get the last colour
+        col_grid, col_avalanche = st.columns(2)
+        self.grid_renderer = FrameRenderer(col_grid.empty(), ['black', 'red', 'orange', 'yellow', 'white'])
+        self.avalanche_renderer = FrameRenderer(col_avalanche.empty(), ['black', 'purple', 'blue', 'red', 'orange', 'yellow'])
+        self.grid_renderer.render(self.grid, caption="Initial state. Height: black 0, red 1, orange 2, yellow 3, white 4")
+        self.avalanche_renderer.render(self.avalanche_grid, caption="Avalanche Size Heatmap. Topplings: black 0, purple 1, blue 2, red 3, orange 4, yellow 5+")
+
+
+    def _append_fig(self, step, snapshot):
+        grid, avalanche_grid, avalanche_size = snapshot
+        self.grid_renderer.render(grid, caption=f"Step {step + 1}, render {self.grid_renderer.last_render_ms():.1f} ms")
+        self.avalanche_renderer.render(avalanche_grid, caption=f"Avalanche size {avalanche_size}")
 
 
     def animate(self):
         # Initialize
         self._streamlit_setup()
         self._initial_grid()
-        
-        # Initial image and figure setup
-        plot_placeholder = st.empty()
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
-        
-        # Grid state plot
-        ax1.set(xticks=[], yticks=[])
-        ax1.set_title("Initial state", fontsize=10)
-        cmap = plt.cm.colors.ListedColormap(['black', 'red', 'orange', 'yellow', 'white'])
-        cax1 = ax1.imshow(self.grid, cmap=cmap, interpolation="nearest", vmin=0, vmax=self.critical_height)
-        cbar1 = fig.colorbar(cax1, ax=ax1, boundaries=np.arange(-0.5, self.critical_height + 1, 1), ticks=range(self.critical_height + 1))
-        cbar1.ax.set_yticklabels([str(i) for i in range(self.critical_height + 1)])
-        cbar1.set_label('Height')
-        
-        # Avalanche size heatmap plot
-        ax2.set(xticks=[], yticks=[])
-        ax2.set_title("Avalanche Size Heatmap", fontsize=10)
-        cmap_avalanche = plt.cm.colors.ListedColormap(['black', 'purple', 'blue', 'red', 'orange', 'yellow'])
-        cax2 = ax2.imshow(self.avalanche_grid, cmap=cmap_avalanche, interpolation="nearest", vmin=0, vmax=5)
-        cbar2 = fig.colorbar(cax2, ax=ax2, boundaries=np.arange(-0.5, 6, 1), ticks=range(6))
-        cbar2.ax.set_yticklabels([str(i) for i in range(6)])
-        cbar2.set_label('Number of Topplings')
-        
-        plot_placeholder.pyplot(fig)
+        self._initial_image()
       
-        # Run simulation if button is pressed
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.button("Play", key='play_button', help='Click to start the simulation', use_container_width=True):
-                for step in range(self.time_steps):
-                    self._step()    
-                    
-                    # Update the data in the images
-                    cax1.set_data(self.grid)
-                    ax1.set_title(f"Step {step + 1}", fontsize=10)
-                    cax2.set_data(self.avalanche_grid)
-                    
-                    plot_placeholder.pyplot(fig)
-                    
-                    time.sleep(0.1)  # Small delay to visualize the simulation
-
+        # The heights of the last run with the same parameters in this session are kept on disk, and survive reruns
+        parameters = {"N": self.N, "add_location": self.add_location, "topple_method": self.topple_method}
+        self.history = session_history("Sandpile", parameters, self.grid.shape, np.uint8)
+        show = lambda step, grid: self.grid_renderer.render(grid, caption=f"Recorded step {step}")
+        action = history_controls(self.history, show)
+        
+        if self._bulk_setup():
+            self._show_bulk()
+        else:
+            # The heights after every grain are a frame. Frames are skipped if the simulation is faster than 10 frames per second
+            play_history(action, self.history, self, lambda: self.grid, self._step, self._snapshot, self._append_fig, show, self.time_steps)
@@ -3,6 +3,8 @@ import streamlit as st
 import numpy as np
 import plotly.graph_objects as go
 
+from result_cache import ResultCache
+
 
 class SineWaveModel:
     def __init(self):
@@ -41,13 +43,19 @@ class SineWaveModel:
                                 method="animate",
                                 args=[None, {"frame": {"duration": 20, "redraw": True}, "fromcurrent": True, "mode": "immediate"}],
                         )])]))
-        st.plotly_chart(self.fig)
 
 
     def animate(self):
         self._streamlit_setup()
-        self._frames()
-        self._animated_figure()
+        # The animation only depends on the frequency, so building its 500 frames is skipped when it was built before
+        cache = ResultCache()
+        figure = cache.get("Sine wave", {"frequency": self.frequency}, None, 500)
+        if figure is None:
+            self._frames()
+            self._animated_figure()
+            figure = self.fig.to_dict()
+            cache.put("Sine wave", {"frequency": self.frequency}, None, 500, figure)
+        st.plotly_chart(figure)
         
         
 
@@ -0,0 +1,167 @@
+import argparse
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import registry
+
+
+class RunningStats:
+    def __init__(self):
+        """Mean and variance of a stream of numbers with Welford's algorithm, without storing the numbers."""
+        self.count = 0
+        self.mean = 0.
+        self._m2 = 0.  # Sum of squared deviations from the mean
+
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else np.nan
+
+
+    @property
+    def standard_error(self):
+        return np.sqrt(self.variance / self.count) if self.count > 1 else np.nan
+
+
+def _ising_sample(simulation):
+    m = abs(np.mean(simulation.grid))
+    return {"magnetization": m, "magnetization_squared": m * m}
+
+
+def _ising_summary(simulation, means):
+    # Fluctuation-dissipation: chi = beta N^2 (<m^2> - <|m|>^2), with m the magnetization per spin
+    susceptibility = simulation.beta * simulation.N**2 * (means["magnetization_squared"] - means["magnetization"]**2)
+    return {"magnetization": means["magnetization"], "susceptibility": susceptibility}
+
+
+def _sandpile_sample(simulation):
+    return {
+        "avalanche_size": simulation.avalanche_size, "avalanche_area": simulation.avalanche_area,
+        "avalanche_duration": simulation.avalanche_duration,
+    }
+
+
+def _lichen_sample(simulation):
+    return {"number_of_species": simulation.number_of_species}
+
+
+# For every model, the observables measured after each sample interval,
+# and how the time averages of one replica are turned into the reported observables
+OBSERVABLES = {
+    "Ising": (_ising_sample, _ising_summary),
+    "Sandpile": (_sandpile_sample, lambda simulation, means: means),
+    "Lichen": (_lichen_sample, lambda simulation, means: means),
+}
+
+
+def run_replica(model, parameters, seed, samples=1000, warmup=100, sample_interval=1):
+    """Run one simulation core without any plotting and return its time averaged observables.
+    After warmup steps, the observables are measured samples times, every sample_interval steps.
+    """
+    sample, summary = OBSERVABLES[model]
+    simulation = registry.create_simulation(model, parameters, seed)
+    registry.advance(model, simulation, warmup)
+
+    stats = {}
+    for _ in range(samples):
+        registry.advance(model, simulation, sample_interval)
+        for name, value in sample(simulation).items():
+            stats.setdefault(name, RunningStats()).add(value)
+    return summary(simulation, {name: running.mean for name, running in stats.items()})
+
+
+def parameter_grid(model, values):
+    """All combinations of the given parameter values, e.g. {"temperature": [1.5, 2.0], "N": [32]}.
+    Values are checked against the parameter schema of the model.
+    """
+    names = list(values)
+    points = [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+    for point in points:
+        registry.validate_parameters(model, point)
+    return points
+
+
+def sweep(model, values, replicas=4, seed=None, processes=None, **run_settings):
+    """Run replicas independent replicas at every point of the parameter grid in a process pool.
+    Every replica gets its own random stream, spawned from seed. Replica results are merged as they arrive,
+    so only the running mean and variance per point and observable are kept. run_settings go to run_replica.
+    Returns one row per grid point.
+    """
+    if model not in OBSERVABLES:
+        raise ValueError(f"No observables defined for {model}, choose from {list(OBSERVABLES)}")
+    points = parameter_grid(model, values)
+    streams = np.random.SeedSequence(seed).spawn(len(points) * replicas)
+    results = [{} for _ in points]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {}
+        for task, stream in enumerate(streams):
+            point = task // replicas
+            # A list of integers seeds both a Generator and a SeedSequence, so every core accepts it
+            replica_seed = stream.generate_state(4).tolist()
+            futures[pool.submit(run_replica, model, points[point], replica_seed, **run_settings)] = point
+        for future in as_completed(futures):
+            for name, value in future.result().items():
+                results[futures[future]].setdefault(name, RunningStats()).add(value)
+
+    rows = []
+    for point, stats in zip(points, results):
+        row = dict(point, replicas=replicas)
+        for name, running in stats.items():
+            row[f"{name}_mean"] = running.mean
+            row[f"{name}_std"] = np.sqrt(running.variance)
+            row[f"{name}_stderr"] = running.standard_error
+        rows.append(row)
+    return rows
+
+
+def write_table(rows, path):
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: f"{value:.6g}" if isinstance(value, float) else value for key, value in row.items()})
+
+
+def _parse_values(model, arguments):
+    values = {}
+    schema = registry.parameter_schema(model)
+    for name, *raw_values in arguments:
+        if name not in schema:
+            raise SystemExit(f"Unknown parameter {name} for {model}, choose from {list(schema)}")
+        convert = {"int": int, "float": float, "choice": str}[schema[name]["type"]]
+        values[name] = [convert(value) for value in raw_values]
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep a parameter grid with independent replicas and write mean observables to a CSV table.",
+        epilog="Example: python sweep.py Ising --values temperature 1.5 2.0 2.27 2.5 3.0 --values N 32 --replicas 8",
+    )
+    parser.add_argument("model", choices=list(OBSERVABLES))
+    parser.add_argument("--values", nargs="+", action="append", default=[], metavar=("NAME", "VALUE"),
+                        help="A parameter name followed by its values. Repeat for more parameters")
+    parser.add_argument("--replicas", type=int, default=4, help="Independent runs per grid point")
+    parser.add_argument("--samples", type=int, default=1000, help="Measurements per run")
+    parser.add_argument("--warmup", type=int, default=100, help="Steps before the first measurement")
+    parser.add_argument("--interval", type=int, default=1, help="Steps between measurements")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of all random streams")
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--output", default="sweep.csv", help="Output .csv file")
+    args = parser.parse_args()
+
+    rows = sweep(args.model, _parse_values(args.model, args.values), replicas=args.replicas, seed=args.seed, processes=args.processes,
+                 samples=args.samples, warmup=args.warmup, sample_interval=args.interval)
+    write_table(rows, args.output)
+    print(f"Wrote {len(rows)} grid points with {args.replicas} replicas each to {args.output}")
@@ -0,0 +1,28 @@
+import numpy as np
+
+from ising_core import IsingSimulation
+
+
+def run_averages(update_method, number_of_steps, seeds, warmup=100):
+    """Per seed averages of the energy and |magnetization| per spin at N = 16 and T = 2.5, after warmup steps."""
+    energy, magnetization = [], []
+    for seed in seeds:
+        simulation = IsingSimulation(N=16, temperature=2.5, update_method=update_method, structure_interval=10**9, seed=seed)
+        simulation._initialize_grid()
+        samples = []
+        for step in range(number_of_steps):
+            simulation._ising_step()
+            if step >= warmup:
+                samples.append((simulation.energy[-1], simulation.magnetization[-1]))
+        energy.append(np.mean(samples, axis=0)[0])
+        magnetization.append(np.mean(samples, axis=0)[1])
+    return np.array(energy), np.array(magnetization)
+
+
+def test_wolff_agrees_with_checkerboard():
+    # Wolff steps decorrelate much faster, so fewer of them give similar error bars
+    checkerboard = run_averages("Checkerboard", 4000, range(10))
+    wolff = run_averages("Wolff cluster", 500, range(100, 110))
+    for a, b in zip(checkerboard, wolff):
+        error = np.hypot(a.std(ddof=1), b.std(ddof=1)) / np.sqrt(len(a))
+        assert abs(a.mean() - b.mean()) < 4 * error
@@ -0,0 +1,59 @@
+import numpy as np
+
+import registry
+from lichen_core import LichenSimulation
+from result_cache import ResultCache, advance_cached
+
+
+def run(chunks, **parameters):
+    simulation = LichenSimulation(L=40, alpha=0.5, gamma=0.3, seed=3, **parameters)
+    simulation._initialize_grid()
+    for number_of_steps in chunks:
+        simulation._lichen_steps(number_of_steps)
+    return simulation
+
+
+def assert_same_run(a, b):
+    np.testing.assert_array_equal(a.lichen, b.lichen)
+    np.testing.assert_array_equal(a.population, b.population)
+    assert a.time == b.time
+    assert a.event_rng.bit_generator.state == b.event_rng.bit_generator.state
+
+
+def test_tiles_do_not_depend_on_chunks():
+    # Long enough for several invasions and spawns, which are rare per step
+    assert_same_run(run([200_000], storage="Tiles", tile_size=8), run([100_000, 100_000], storage="Tiles", tile_size=8))
+    assert_same_run(run([200], storage="Tiles", tile_size=8), run([100, 100], storage="Tiles", tile_size=8))
+
+
+def test_tiles_resume_from_checkpoint():
+    simulation = run([100_000], storage="Tiles", tile_size=8)
+    resumed = run([], storage="Tiles", tile_size=8)
+    resumed.restore(simulation.checkpoint())
+    simulation._lichen_steps(100_000)
+    resumed._lichen_steps(100_000)
+    assert_same_run(simulation, resumed)
+
+
+def test_kinetic_monte_carlo_does_not_depend_on_chunks():
+    method = {"update_method": "Kinetic Monte Carlo"}
+    assert_same_run(run([200_000], **method), run([100_000, 100_000], **method))
+    assert_same_run(run([200], **method), run([150, 50], **method))
+
+
+def test_kinetic_monte_carlo_through_cache(tmp_path):
+    parameters = {"L": 40, "alpha": 0.5, "gamma": 0.3, "update_method": "Kinetic Monte Carlo"}
+    direct = registry.create_simulation("Lichen", parameters, seed=3)
+    registry.advance("Lichen", direct, 200_000)
+
+    cache = ResultCache(tmp_path)
+    chunked = registry.create_simulation("Lichen", parameters, seed=3)
+    advance_cached(cache, "Lichen", parameters, 3, chunked, 0, 150_000, checkpoint_interval=100_000)
+    advance_cached(cache, "Lichen", parameters, 3, chunked, 150_000, 50_000, checkpoint_interval=100_000)
+    assert_same_run(direct, chunked)
+
+    # A second run restores the checkpoint at 100000 from the cache and continues from there
+    restored = registry.create_simulation("Lichen", parameters, seed=3)
+    advance_cached(cache, "Lichen", parameters, 3, restored, 0, 150_000, checkpoint_interval=100_000)
+    assert cache.hits == 1
+    assert_same_run(run([150_000], update_method="Kinetic Monte Carlo"), restored)
@@ -1,9 +1,63 @@
-from flask import Flask, jsonify, request
+import base64
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 
+from frame_encoding import FrameEncoder
+from sessions import SessionManager
+
+# The simulation cores and the model registry live next to the Streamlit app
+MODEL_PATH = str(Path(__file__).resolve().parents[2] / "jupyter")
+sys.path.insert(0, MODEL_PATH)
+import registry
+
 app = Flask(__name__)
 CORS(app)
 
+# Upper bound of the steps of a single request, also per frame of a stream
+MAX_STEPS_PER_REQUEST = 1_000_000
+# Bounds of a stream, which holds a server thread for frames / fps seconds
+MIN_FPS = 0.1
+MAX_FPS = 120
+MAX_FRAMES = 100_000
+
+# Live simulation runs, kept in worker processes. Started on first use so importing the app does not start processes
+_sessions = None
+
+
+def _get_sessions():
+    global _sessions
+    if _sessions is None:
+        _sessions = SessionManager(MODEL_PATH)
+    return _sessions
+
+
+def _to_json(state):
+    """Convert numpy arrays and scalars in a model state to plain Python, with NaN as null."""
+    converted = {}
+    for key, value in state.items():
+        if isinstance(value, (np.ndarray, np.generic)):
+            value = value.tolist()
+        if isinstance(value, float) and np.isnan(value):
+            value = None
+        converted[key] = value
+    return converted
+
+
+def _get_model(run_id):
+    """Model name of a run, or an error response if the run does not exist or has been evicted."""
+    try:
+        return _get_sessions().model(run_id), None
+    except KeyError:
+        return None, (jsonify({"error": f"Unknown or expired run {run_id}"}), 404)
+
+
 @app.route("/api/model", methods=["POST"])
 def model():
     data = request.json
@@ -12,5 +66,127 @@ def model():
     result = {key: value ** 2 for key, value in params.items()}  # Dummy calculation
     return jsonify({"result": result})
 
+
+@app.route("/api/models", methods=["GET"])
+def models():
+    """Parameter schema of every model. Does not import any model."""
+    return jsonify({name: registry.parameter_schema(name) for name in registry.MODELS})
+
+
+@app.route("/api/runs", methods=["POST"])
+def create_run():
+    data = request.json or {}
+    model_name = data.get("model")
+    try:
+        run_id = _get_sessions().create(model_name, data.get("parameters", {}), data.get("seed"))
+    except (ValueError, TypeError) as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify({"run_id": run_id, "model": model_name}), 201
+
+
+@app.route("/api/runs/<run_id>/step", methods=["POST"])
+def step_run(run_id):
+    try:
+        number_of_steps = int((request.json or {}).get("steps", 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "steps must be an integer"}), 400
+    if not 1 <= number_of_steps <= MAX_STEPS_PER_REQUEST:
+        return jsonify({"error": f"steps must be between 1 and {MAX_STEPS_PER_REQUEST}"}), 400
+    try:
+        step, state = _get_sessions().step(run_id, number_of_steps)
+    except KeyError:
+        return jsonify({"error": f"Unknown or expired run {run_id}"}), 404
+    return jsonify({"run_id": run_id, "step": step, "state": _to_json(state)})
+
+
+@app.route("/api/runs/<run_id>", methods=["GET"])
+def get_run(run_id):
+    model_name, error = _get_model(run_id)
+    if error:
+        return error
+    try:
+        step, state = _get_sessions().state(run_id)
+    except KeyError:
+        return jsonify({"error": f"Unknown or expired run {run_id}"}), 404
+    return jsonify({"run_id": run_id, "model": model_name, "step": step, "state": _to_json(state)})
+
+
+def _frame_key(model_name):
+    return registry.MODELS[model_name].get("frame")
+
+
+@app.route("/api/runs/<run_id>/frame", methods=["GET"])
+def get_frame(run_id):
+    """The current grid as a single binary frame, see frame_encoding."""
+    model_name, error = _get_model(run_id)
+    if error:
+        return error
+    if _frame_key(model_name) is None:
+        return jsonify({"error": f"{model_name} has no grid to stream"}), 400
+
+    encoder = FrameEncoder()
+    try:
+        step, state = _get_sessions().state(run_id)
+    except KeyError:
+        return jsonify({"error": f"Unknown or expired run {run_id}"}), 404
+    frame = encoder.encode(state[_frame_key(model_name)], step)
+    stats = encoder.stats()
+    return Response(frame, mimetype="application/octet-stream", headers={
+        "X-Frame-Bytes": str(stats["last_bytes_per_frame"]), "X-Encode-Time-Ms": f"{stats['mean_encode_ms']:.3f}",
+    })
+
+
+@app.route("/api/runs/<run_id>/stream", methods=["GET"])
+def stream_run(run_id):
+    """Server-sent events with one base64 encoded binary frame per "frame" event.
+    Query parameters: fps (default 30, between MIN_FPS and MAX_FPS), steps_per_frame (default 1)
+    and frames (default 1000, at most MAX_FRAMES).
+    A "stats" event with bytes per frame and encode time is sent every second, and once more in the final "end" event.
+    """
+    model_name, error = _get_model(run_id)
+    if error:
+        return error
+    if _frame_key(model_name) is None:
+        return jsonify({"error": f"{model_name} has no grid to stream"}), 400
+    try:
+        fps = float(request.args.get("fps", 30))
+        steps_per_frame = int(request.args.get("steps_per_frame", 1))
+        number_of_frames = int(request.args.get("frames", 1000))
+    except ValueError:
+        return jsonify({"error": "fps, steps_per_frame and frames must be numbers"}), 400
+    # Checked before the response starts, as errors inside the stream would only break it
+    if not (math.isfinite(fps) and MIN_FPS <= fps <= MAX_FPS):
+        return jsonify({"error": f"fps must be between {MIN_FPS} and {MAX_FPS}"}), 400
+    if not 1 <= steps_per_frame <= MAX_STEPS_PER_REQUEST:
+        return jsonify({"error": f"steps_per_frame must be between 1 and {MAX_STEPS_PER_REQUEST}"}), 400
+    if not 1 <= number_of_frames <= MAX_FRAMES:
+        return jsonify({"error": f"frames must be between 1 and {MAX_FRAMES}"}), 400
+
+    def events():
+        encoder = FrameEncoder()
+        for frame_number in range(number_of_frames):
+            tick = time.perf_counter()
+            try:
+                step, state = _get_sessions().step(run_id, steps_per_frame)
+            except KeyError:
+                # Evicted or deleted while streaming
+                break
+            frame = encoder.encode(state[_frame_key(model_name)], step)
+            yield f"event: frame\ndata: {base64.b64encode(frame).decode('ascii')}\n\n"
+            if (frame_number + 1) % max(1, int(fps)) == 0:
+                yield f"event: stats\ndata: {json.dumps(encoder.stats())}\n\n"
+            time.sleep(max(0., 1 / fps - (time.perf_counter() - tick)))
+        yield f"event: end\ndata: {json.dumps(encoder.stats())}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/api/runs/<run_id>", methods=["DELETE"])
+def delete_run(run_id):
+    _get_sessions().delete(run_id)
+    return "", 204
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # Requests for runs on different workers are handled in parallel
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,133 @@
+"""Compact binary encoding of simulation grids for streaming to the frontend.
+
+Every frame is a 24 byte little-endian header followed by the payload:
+
+    magic     4s   b"WIMF"
+    version   u8
+    encoding  u8   RAW, RLE or DELTA
+    dtype     u8   see DTYPES
+    reserved  u8
+    height    u16
+    width     u16
+    step      u64  simulation step of the frame
+    length    u32  payload length in bytes
+
+RAW is the grid in row-major order. RLE is the number of runs (u32), the run values and the run lengths (u16).
+DELTA is the RLE encoding of the grid minus the previous frame, with wrap-around, so unchanged sites become long runs of zeros.
+"""
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"WIMF"
+VERSION = 2
+HEADER = struct.Struct("<4sBBBBHHQI")
+RAW, RLE, DELTA = 0, 1, 2
+DTYPES = [np.dtype(np.uint8), np.dtype(np.int8), np.dtype(np.uint16), np.dtype(np.int16)]
+MAX_RUN = np.iinfo(np.uint16).max
+
+
+def compact_dtype(grid):
+    """Smallest dtype in DTYPES that holds all values of the grid."""
+    low, high = grid.min(), grid.max()
+    for dtype in DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    raise ValueError(f"Grid values between {low} and {high} do not fit in 16 bits")
+
+
+def _unsigned(values):
+    # Same bits as an unsigned integer, so differences wrap around instead of overflowing
+    return values.view(np.dtype(f"u{values.dtype.itemsize}"))
+
+
+def run_length_encode(values):
+    flat = values.ravel()
+    starts = np.flatnonzero(np.concatenate([[True], flat[1:] != flat[:-1]]))
+    lengths = np.diff(np.append(starts, flat.size))
+    # Split runs longer than fits in a u16
+    repeats = -(-lengths // MAX_RUN)
+    run_values = np.repeat(flat[starts], repeats)
+    run_lengths = np.full(repeats.sum(), MAX_RUN, dtype=np.uint16)
+    ends = np.cumsum(repeats) - 1
+    run_lengths[ends] = lengths - (repeats - 1) * MAX_RUN
+    return struct.pack("<I", run_values.size) + run_values.tobytes() + run_lengths.tobytes()
+
+
+def run_length_decode(payload, dtype, size):
+    number_of_runs, = struct.unpack_from("<I", payload)
+    offset = 4 + number_of_runs * dtype.itemsize
+    run_values = np.frombuffer(payload, dtype=dtype, count=number_of_runs, offset=4)
+    run_lengths = np.frombuffer(payload, dtype=np.uint16, count=number_of_runs, offset=offset)
+    values = np.repeat(run_values, run_lengths)
+    assert values.size == size
+    return values
+
+
+class FrameEncoder:
+    def __init__(self, keyframe_interval=100):
+        """Encodes the frames of one stream. Every frame uses whichever of RAW, RLE and DELTA is smallest,
+        except that at least every keyframe_interval frames a frame is sent without DELTA, so a client can always resynchronize.
+        Bytes and encode time of every frame are recorded.
+        """
+        self.keyframe_interval = keyframe_interval
+        self.previous = None
+        self.frames_since_keyframe = 0
+        self.frame_bytes = []
+        self.encode_times = []
+
+
+    def encode(self, grid, step):
+        start = time.perf_counter()
+        dtype = compact_dtype(grid)
+        values = np.ascontiguousarray(grid, dtype=dtype)
+
+        candidates = {RAW: values.tobytes(), RLE: run_length_encode(values)}
+        use_delta = (
+            self.previous is not None and self.previous.shape == values.shape and self.previous.dtype == dtype
+            and self.frames_since_keyframe < self.keyframe_interval
+        )
+        if use_delta:
+            candidates[DELTA] = run_length_encode(_unsigned(values) - _unsigned(self.previous))
+        encoding = min(candidates, key=lambda key: len(candidates[key]))
+        payload = candidates[encoding]
+
+        self.frames_since_keyframe = self.frames_since_keyframe + 1 if encoding == DELTA else 0
+        self.previous = values
+        height, width = values.shape
+        frame = HEADER.pack(MAGIC, VERSION, encoding, DTYPES.index(dtype), 0, height, width, step, len(payload)) + payload
+
+        self.encode_times.append(time.perf_counter() - start)
+        self.frame_bytes.append(len(frame))
+        return frame
+
+
+    def stats(self):
+        if not self.frame_bytes:
+            return {"frames": 0}
+        return {
+            "frames": len(self.frame_bytes),
+            "mean_bytes_per_frame": float(np.mean(self.frame_bytes)),
+            "last_bytes_per_frame": self.frame_bytes[-1],
+            "mean_encode_ms": 1000 * float(np.mean(self.encode_times)),
+        }
+
+
+def decode_frame(frame, previous=None):
+    """Decode a frame into (step, grid). previous is the grid of the previous frame, needed for DELTA frames."""
+    magic, version, encoding, dtype_code, _, height, width, step, length = HEADER.unpack_from(frame)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a frame of a supported version")
+    dtype = DTYPES[dtype_code]
+    payload = frame[HEADER.size:HEADER.size + length]
+
+    if encoding == RAW:
+        values = np.frombuffer(payload, dtype=dtype)
+    elif encoding == RLE:
+        values = run_length_decode(payload, dtype, height * width)
+    else:
+        delta = run_length_decode(payload, _unsigned(np.zeros(0, dtype=dtype)).dtype, height * width)
+        values = (_unsigned(previous.ravel()) + delta).view(dtype)
+    return step, values.reshape(height, width)
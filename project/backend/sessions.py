@@ -0,0 +1,228 @@
+"""Simulation runs kept alive between requests in worker processes.
+
+Each worker process owns the simulations of the runs assigned to it, and answers one command at a time over a pipe.
+A long step on one worker only delays requests for runs on that worker, and is split into slices of a fraction of a second,
+so commands for other runs on the same worker are answered in between. Runs are evicted when they have been idle
+for too long, and the least recently used run of a worker is evicted when the worker has too many runs or uses too much memory.
+"""
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RunNotFound(KeyError):
+    pass
+
+
+def _worker_main(connection, model_path):
+    sys.path.insert(0, model_path)
+    import registry
+    from profiling import approximate_bytes
+    from result_cache import ResultCache, advance_cached
+
+    # Seeded runs are deterministic, so they restore checkpoints computed by any earlier run with the same parameters
+    cache = ResultCache()
+    simulations = {}
+    while True:
+        try:
+            command, run_id, arguments = connection.recv()
+        except EOFError:
+            return
+        try:
+            if command == "create":
+                model, parameters, seed = arguments
+                simulations[run_id] = {
+                    "model": model, "parameters": parameters, "seed": seed, "step": 0,
+                    "simulation": registry.create_simulation(model, parameters, seed),
+                }
+                reply = None
+            elif command == "step":
+                # Advance in growing chunks until all steps are done or the time slice is used up.
+                # Replies with the number of steps done, and the state once all are done
+                run = simulations[run_id]
+                number_of_steps, time_slice = arguments
+                done, chunk = 0, 1
+                start = time.perf_counter()
+                while done < number_of_steps and (done == 0 or time.perf_counter() - start < time_slice):
+                    chunk = min(chunk, number_of_steps - done)
+                    if run["seed"] is None:
+                        registry.advance(run["model"], run["simulation"], chunk)
+                    else:
+                        advance_cached(cache, run["model"], run["parameters"], run["seed"], run["simulation"], run["step"], chunk)
+                    run["step"] += chunk
+                    done += chunk
+                    chunk *= 2
+                reply = done, run["simulation"].state() if done == number_of_steps else None
+            elif command == "state":
+                reply = simulations[run_id]["simulation"].state()
+            elif command == "delete":
+                simulations.pop(run_id, None)
+                reply = None
+            else:
+                raise ValueError(f"Unknown command {command}")
+            memory = approximate_bytes(simulations[run_id]["simulation"]) if run_id in simulations else 0
+            connection.send(("ok", reply, memory))
+        except Exception as error:
+            connection.send(("error", error, 0))
+
+
+class SessionManager:
+    def __init__(self, model_path, number_of_workers=4, max_runs_per_worker=64, max_bytes_per_worker=500_000_000, idle_timeout=900,
+                 time_slice=0.1):
+        """model_path is the directory of the model registry. Runs idle for more than idle_timeout seconds are evicted,
+        checked by a background thread. A worker spends at most about time_slice seconds on one command.
+        """
+        self.model_path = model_path
+        self.max_runs_per_worker = max_runs_per_worker
+        self.max_bytes_per_worker = max_bytes_per_worker
+        self.idle_timeout = idle_timeout
+        self.time_slice = time_slice
+        self.lock = threading.Lock()  # Guards self.runs
+        # Run ID -> {"worker", "model", "step", "bytes", "last_used"}, least recently used first
+        self.runs = OrderedDict()
+        self.workers = [self._start_worker() for _ in range(number_of_workers)]
+        self.stopped = threading.Event()
+        self.evictor = threading.Thread(target=self._evict_idle_periodically, daemon=True)
+        self.evictor.start()
+
+
+    def _start_worker(self):
+        connection, child_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_main, args=(child_connection, self.model_path), daemon=True)
+        process.start()
+        # Only one request at a time can use the pipe of a worker
+        return {"process": process, "connection": connection, "lock": threading.Lock()}
+
+
+    def _call(self, worker_index, command, run_id, arguments=None):
+        worker = self.workers[worker_index]
+        with worker["lock"]:
+            try:
+                worker["connection"].send((command, run_id, arguments))
+                status, reply, memory = worker["connection"].recv()
+            except (EOFError, BrokenPipeError):
+                self._restart_worker(worker_index)
+                raise RuntimeError("The worker process died, its runs are lost")
+        if status == "error":
+            raise reply
+        return reply, memory
+
+
+    def _restart_worker(self, worker_index):
+        self.workers[worker_index]["process"].kill()
+        self.workers[worker_index] = self._start_worker()
+        with self.lock:
+            for run_id in [run_id for run_id, run in self.runs.items() if run["worker"] == worker_index]:
+                del self.runs[run_id]
+
+
+    def _touch(self, run_id):
+        with self.lock:
+            if run_id not in self.runs:
+                raise RunNotFound(run_id)
+            self.runs.move_to_end(run_id)
+            self.runs[run_id]["last_used"] = time.monotonic()
+            return self.runs[run_id]
+
+
+    def _evict(self, run_ids):
+        for run_id in run_ids:
+            with self.lock:
+                run = self.runs.pop(run_id, None)
+            if run is not None:
+                self._call(run["worker"], "delete", run_id)
+
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [run_id for run_id, run in self.runs.items() if now - run["last_used"] > self.idle_timeout]
+        self._evict(idle)
+
+
+    def _evict_idle_periodically(self):
+        # Idle runs are found within a tenth of the timeout, also when no requests arrive
+        while not self.stopped.wait(max(1., self.idle_timeout / 10)):
+            try:
+                self.evict_idle()
+            except RuntimeError:  # A worker died, its runs are already gone
+                pass
+
+
+    def _evict_over_capacity(self, worker_index, keep):
+        """Evict the least recently used runs of a worker until it is within its run and memory limits."""
+        with self.lock:
+            worker_runs = [(run_id, run) for run_id, run in self.runs.items() if run["worker"] == worker_index]
+            number_of_runs = len(worker_runs)
+            memory = sum(run["bytes"] for _, run in worker_runs)
+            evict = []
+            for run_id, run in worker_runs:
+                if number_of_runs <= self.max_runs_per_worker and memory <= self.max_bytes_per_worker:
+                    break
+                if run_id != keep:
+                    evict.append(run_id)
+                    number_of_runs -= 1
+                    memory -= run["bytes"]
+        self._evict(evict)
+
+
+    def create(self, model, parameters=None, seed=None):
+        self.evict_idle()
+        with self.lock:
+            runs_per_worker = [0] * len(self.workers)
+            for run in self.runs.values():
+                runs_per_worker[run["worker"]] += 1
+        worker_index = int(np.argmin(runs_per_worker))
+
+        run_id = uuid.uuid4().hex
+        _, memory = self._call(worker_index, "create", run_id, (model, parameters or {}, seed))
+        with self.lock:
+            self.runs[run_id] = {"worker": worker_index, "model": model, "step": 0, "bytes": memory, "last_used": time.monotonic()}
+        self._evict_over_capacity(worker_index, keep=run_id)
+        return run_id
+
+
+    def step(self, run_id, number_of_steps=1):
+        """Advance a run and return (step, state). The worker is released after every time slice,
+        so other runs on it are not blocked by a long advance.
+        """
+        run = self._touch(run_id)
+        remaining = number_of_steps
+        while remaining > 0:
+            (done, state), memory = self._call(run["worker"], "step", run_id, (remaining, self.time_slice))
+            remaining -= done
+            with self.lock:
+                run["step"] += done
+                run["bytes"] = memory
+            if remaining > 0:
+                # Evicted or deleted between two slices
+                self._touch(run_id)
+        self._evict_over_capacity(run["worker"], keep=run_id)
+        return run["step"], state
+
+
+    def state(self, run_id):
+        """Return (step, state) of a run without advancing it."""
+        run = self._touch(run_id)
+        state, _ = self._call(run["worker"], "state", run_id)
+        return run["step"], state
+
+
+    def model(self, run_id):
+        return self._touch(run_id)["model"]
+
+
+    def delete(self, run_id):
+        self._evict([run_id])
+
+
+    def shutdown(self):
+        self.stopped.set()
+        for worker in self.workers:
+            worker["connection"].close()
+            worker["process"].join(timeout=1)
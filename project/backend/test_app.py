@@ -0,0 +1,31 @@
+import pytest
+
+import app as backend
+
+
+@pytest.fixture(scope="module")
+def client_and_run():
+    client = backend.app.test_client()
+    run_id = client.post("/api/runs", json={"model": "Ising", "parameters": {"N": 10}, "seed": 1}).json["run_id"]
+    yield client, run_id
+    backend._get_sessions().shutdown()
+
+
+@pytest.mark.parametrize("query", [
+    "fps=nan", "fps=inf", "fps=-inf", "fps=0", "fps=-1", "fps=121", "fps=1e-9", "fps=0.05", "fps=abc",
+    "frames=0", "frames=100001", "frames=1e3", "steps_per_frame=0", "steps_per_frame=1000001",
+])
+def test_stream_rejects_bad_parameters(client_and_run, query):
+    client, run_id = client_and_run
+    response = client.get(f"/api/runs/{run_id}/stream?{query}")
+    assert response.status_code == 400
+    assert "error" in response.json
+
+
+def test_stream_sends_frames(client_and_run):
+    client, run_id = client_and_run
+    response = client.get(f"/api/runs/{run_id}/stream?fps=120&frames=3")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert body.count("event: frame") == 3
+    assert "event: end" in body
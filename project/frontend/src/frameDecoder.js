@@ -0,0 +1,69 @@
+// Decoder for the binary frames sent by the backend, see project/backend/frame_encoding.py for the format.
+const MAGIC = "WIMF";
+const VERSION = 2;
+const HEADER_SIZE = 24;
+const RAW = 0;
+const RLE = 1;
+const DTYPES = [Uint8Array, Int8Array, Uint16Array, Int16Array];
+const UNSIGNED = [Uint8Array, Uint8Array, Uint16Array, Uint16Array];
+
+export function base64ToBuffer(data) {
+  const binary = atob(data);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return bytes.buffer;
+}
+
+function runLengthDecode(buffer, offset, ArrayType, size) {
+  const view = new DataView(buffer);
+  const numberOfRuns = view.getUint32(offset, true);
+  const valuesStart = offset + 4;
+  const lengthsStart = valuesStart + numberOfRuns * ArrayType.BYTES_PER_ELEMENT;
+  // Copy the run values, as they are not necessarily aligned in the buffer
+  const runValues = new ArrayType(buffer.slice(valuesStart, lengthsStart));
+  const values = new ArrayType(size);
+  let position = 0;
+  for (let i = 0; i < numberOfRuns; i++) {
+    const length = view.getUint16(lengthsStart + 2 * i, true);
+    values.fill(runValues[i], position, position + length);
+    position += length;
+  }
+  return values;
+}
+
+// Returns {step, height, width, values}, with step a BigInt. previous is the decoded previous frame, needed for delta frames.
+export function decodeFrame(buffer, previous) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC || view.getUint8(4) !== VERSION) {
+    throw new Error("Not a frame of a supported version");
+  }
+  const encoding = view.getUint8(5);
+  const dtype = view.getUint8(6);
+  const height = view.getUint16(8, true);
+  const width = view.getUint16(10, true);
+  // Steps can exceed 2^53, so the step is a BigInt
+  const step = view.getBigUint64(12, true);
+  const size = height * width;
+  const ArrayType = DTYPES[dtype];
+
+  let values;
+  if (encoding === RAW) {
+    values = new ArrayType(buffer.slice(HEADER_SIZE, HEADER_SIZE + size * ArrayType.BYTES_PER_ELEMENT));
+  } else if (encoding === RLE) {
+    values = runLengthDecode(buffer, HEADER_SIZE, ArrayType, size);
+  } else {
+    // Delta against the previous frame, wrapping around like unsigned integers
+    const Unsigned = UNSIGNED[dtype];
+    const delta = runLengthDecode(buffer, HEADER_SIZE, Unsigned, size);
+    const previousUnsigned = new Unsigned(previous.values.buffer);
+    const unsigned = new Unsigned(size);
+    for (let i = 0; i < size; i++) {
+      unsigned[i] = previousUnsigned[i] + delta[i];
+    }
+    values = new ArrayType(unsigned.buffer);
+  }
+  return { step, height, width, values };
+}